@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+import io
+import json
+import random
+import resource
+import subprocess
+import tempfile
+import time
+import zipfile
+import contextlib
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+BENCHMARK_SIZES = (10 ** 3, 10 ** 4, 10 ** 5)
+BENCHMARK_CASES = ('banking', 'transactions', 'simple', 'sixtytwo', 'dzo')
+BENCHMARK_THRESHOLD = 1.25
+BENCHMARK_SEED = 62
+BENCHMARK_FIRST_DAY = date(2024, 1, 1)
+BENCHMARK_HELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'helper.py')
+BENCHMARK_STARTUP_RUNS = 10
+BENCHMARK_HEAVY_MODULES = ('xlwings', 'xlrd', 'chardet', 'dateutil', 'openpyxl', 'calendar', 'sqlite3')
+
+def main(argv):
+    match argv[0] if argv else None:
+        case '--run':
+            benchmark_run_case(argv[1], argv[2:])
+        case '--generate':
+            benchmark_generate_all(argv[1], benchmark_parse_sizes(argv[2]) if argv[2:] else BENCHMARK_SIZES)
+        case None | '--help':
+            benchmark_help()
+        case _:
+            benchmark_suite(argv)
+
+def benchmark_help():
+    print('Use for timing every procedure on generated data, 10^3 to 10^5 rows by default:')
+    print('python benchmark.py --sizes 1000,100000,10000000 --cases banking,dzo')
+    print()
+    print('Startup time is measured first, and the run fails if helper.py imports Excel or')
+    print('detection packages before a procedure needs them.')
+    print()
+    print('Use --data to keep the generated files, --output to append the results as JSON lines,')
+    print('and --baseline to fail when a case is more than 25% slower than a previous run:')
+    print('python benchmark.py --data /tmp/bench --output today.jsonl --baseline yesterday.jsonl')
+    print()
+    print('Use for generating the sample files only:')
+    print('python benchmark.py --generate /tmp/bench 1000,10000')
+    print()
+
+def benchmark_parse_sizes(text):
+    return [int(float(size)) for size in text.split(',') if size]
+
+def benchmark_suite(argv):
+    sizes = BENCHMARK_SIZES
+    cases = BENCHMARK_CASES
+    data = None
+    output = None
+    baseline = None
+    threshold = BENCHMARK_THRESHOLD
+
+    while argv:
+        match argv[0]:
+            case '--sizes':
+                sizes = benchmark_parse_sizes(argv[1])
+            case '--cases':
+                cases = [case for case in argv[1].split(',') if case]
+            case '--data':
+                data = argv[1]
+            case '--output':
+                output = argv[1]
+            case '--baseline':
+                baseline = benchmark_read_results(argv[1])
+            case '--threshold':
+                threshold = float(argv[1])
+            case _:
+                print('Unknown option:', argv[0])
+                print()
+                benchmark_help()
+                return
+
+        argv = argv[2:]
+
+    with contextlib.ExitStack() as stack:
+        if data is None:
+            data = stack.enter_context(tempfile.TemporaryDirectory(prefix='alexsa_bench_'))
+        else:
+            os.makedirs(data, exist_ok=True)
+
+        results = [benchmark_startup()]
+        print('Startup: %.1f ms median over %d runs' % (results[0]['seconds'] * 1000, BENCHMARK_STARTUP_RUNS))
+        if results[0]['modules']:
+            print('Imported at startup: %s' % (', '.join(results[0]['modules']),))
+        print()
+
+        print('%-14s %10s %10s %14s %10s' % ('case', 'rows', 'seconds', 'rows/s', 'peak MB'))
+        for size in sizes:
+            for case in cases:
+                files = BENCHMARK_GENERATORS[case](data, size)
+                result = benchmark_measure(case, size, files)
+                results.append(result)
+                print('%-14s %10d %10.3f %14.0f %10.1f' % (case, size, result['seconds'], size / max(result['seconds'], 1e-9), result['peak_mb']))
+
+    print()
+
+    if output:
+        with open(output, 'a', encoding='utf-8') as file:
+            for result in results:
+                file.write(json.dumps(result) + '\n')
+
+    failed = bool(results[0]['modules'])
+    if baseline:
+        regressions = benchmark_compare(results, baseline, threshold)
+        for (result, previous) in regressions:
+            print('Slower: %s at %d rows, %.3fs against %.3fs' % (result['case'], result['rows'], result['seconds'], previous['seconds']))
+
+        if regressions:
+            print()
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+def benchmark_read_results(name):
+    results = dict()
+    with open(name, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                result = json.loads(line)
+                results[(result['case'], result['rows'])] = result
+
+    return results
+
+def benchmark_compare(results, baseline, threshold):
+    regressions = list()
+    for result in results:
+        previous = baseline.get((result['case'], result['rows']))
+        if previous and result['seconds'] > previous['seconds'] * threshold:
+            regressions.append((result, previous))
+
+    return regressions
+
+def benchmark_startup():
+    timings = list()
+    for run in range(0, BENCHMARK_STARTUP_RUNS):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, BENCHMARK_HELPER], stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - started)
+
+    script = 'import sys; sys.path.insert(0, %r); import helper; print(" ".join([name for name in %r if name in sys.modules]))'
+    command = [sys.executable, '-c', script % (os.path.dirname(BENCHMARK_HELPER), BENCHMARK_HEAVY_MODULES)]
+    modules = subprocess.run(command, capture_output=True, text=True, check=True).stdout.split()
+
+    return {'case': 'startup', 'rows': 0, 'seconds': sorted(timings)[len(timings) // 2], 'peak_mb': 0.0, 'modules': modules}
+
+def benchmark_measure(case, size, files):
+    command = [sys.executable, os.path.abspath(__file__), '--run', case] + files
+    completed = subprocess.run(command, capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result.update({'case': case, 'rows': size})
+    return result
+
+def benchmark_import_helper():
+    if os.path.dirname(BENCHMARK_HELPER) not in sys.path:
+        sys.path.insert(0, os.path.dirname(BENCHMARK_HELPER))
+    import helper
+
+    return helper
+
+def benchmark_run_case(case, files):
+    helper = benchmark_import_helper()
+    helper.common_options.cache = False
+    helper.common_options.history = False
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        match case:
+            case 'banking':
+                helper.main_banking(files)
+            case 'transactions':
+                helper.main_transactions(files)
+            case 'simple':
+                helper.main_simple(files)
+            case 'sixtytwo':
+                helper.main_sixtytwo(files)
+            case 'dzo':
+                benchmark_run_dzo(helper, files[0])
+    seconds = time.perf_counter() - started
+
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(json.dumps({'seconds': seconds, 'peak_mb': peak / 1024}))
+
+def benchmark_run_dzo(helper, name):
+    from dateutil.relativedelta import relativedelta
+
+    transactions = helper.main_dzo_read_source(name)
+    (group_since, group_till) = helper.main_dzo_find_period(transactions)
+
+    first_date = helper.datetime.combine(group_since.replace(day=1), helper.datetime.min.time())
+    months = helper.common_calc_date_diff(first_date, group_till) + 1
+    headers = [first_date + relativedelta(months=ic) for ic in range(0, months)]
+    date_anchor = (helper.MAIN_DZO_FIRST_DATE_COLUMN, first_date, headers)
+
+    (spans, column_max) = helper.main_dzo_plan_spans(transactions, date_anchor)
+    helper.main_dzo_compute_matrix(spans, helper.main_dzo_pad_headers(date_anchor, column_max))
+
+def benchmark_generate_all(data, sizes):
+    os.makedirs(data, exist_ok=True)
+    for size in sizes:
+        for case in BENCHMARK_CASES:
+            for name in BENCHMARK_GENERATORS[case](data, size):
+                print(name)
+
+def benchmark_path(data, size, name):
+    return os.path.join(data, '%d_%s' % (size, name))
+
+def benchmark_needs(*names):
+    return not all([os.path.exists(name) for name in names])
+
+def benchmark_day(random_state, days=365):
+    return BENCHMARK_FIRST_DAY + timedelta(days=random_state.randrange(0, days))
+
+def benchmark_write_xlsx(name, rows):
+    column_letter = benchmark_import_helper().common_column_letter
+    with zipfile.ZipFile(name + '.part', 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>')
+        archive.writestr('_rels/.rels',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>')
+        archive.writestr('xl/workbook.xml',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="Лист1" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        archive.writestr('xl/_rels/workbook.xml.rels',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+            '</Relationships>')
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as stream:
+            writer = io.TextIOWrapper(stream, encoding='utf-8')
+            writer.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            for (ir, row) in enumerate(rows):
+                cells = list()
+                for (ic, value) in enumerate(row):
+                    if value is None or value == '':
+                        continue
+                    elif isinstance(value, str):
+                        cells.append('<c r="%s%d" t="inlineStr"><is><t>%s</t></is></c>' % (column_letter(ic), ir + 1, escape(value)))
+                    else:
+                        cells.append('<c r="%s%d"><v>%r</v></c>' % (column_letter(ic), ir + 1, value))
+                writer.write('<row r="%d">%s</row>' % (ir + 1, ''.join(cells)))
+            writer.write('</sheetData></worksheet>')
+            writer.flush()
+            writer.detach()
+
+    os.replace(name + '.part', name)
+
+def benchmark_write_csv(name, encoding, lines):
+    with open(name + '.part', 'w', encoding=encoding, newline='') as file:
+        for line in lines:
+            file.write(';'.join([str(value) for value in line]) + '\r\n')
+
+    os.replace(name + '.part', name)
+
+def benchmark_generate_banking(data, size):
+    names = [benchmark_path(data, size, name) for name in ('jivo.xlsx', 'alfa.csv', 'yookassa.csv')]
+    if not benchmark_needs(*names):
+        return names
+
+    random_state = random.Random(BENCHMARK_SEED + size)
+    orders = list()
+    for id in range(100000, 100000 + size):
+        marker = 'ALFA-BANK' if random_state.random() < 0.6 else 'YANDEX-JS'
+        orders.append((id, marker, random_state.randrange(100, 50000) / 100, benchmark_day(random_state)))
+
+    def jivo_rows():
+        yield ['Есть файлы', 'Клиент', 'Номер заказа', 'Статус', 'Менеджер', 'Сумма', 'Дата оплаты'] + [''] * 6 + ['Способ оплаты']
+        for (id, marker, amount, day) in orders:
+            yield ['нет', 'Клиент %d' % (id % 997,), id, 'Выполнен', 'Менеджер', amount, day.strftime('%d.%m.%Y')] + [''] * 6 + ['%s payment' % (marker,)]
+
+    def alfabank_lines():
+        yield ['Наименование предприятия', 'ООО Ромашка'] + [''] * 15
+        yield ['Дата операции', 'Счёт', 'Валюта', 'Сумма'] + ['Поле %d' % (ic,) for ic in range(4, 15)] + ['', '']
+        for (id, marker, amount, day) in orders:
+            if marker != 'ALFA-BANK' or random_state.random() < 0.01:
+                continue
+            amount = amount if random_state.random() > 0.01 else amount - 1
+            yield [day.strftime('%d.%m.%Y'), '40702810', 'RUR', ('%.2f' % amount).replace('.', ',')] + [''] * 11 + ['%d.1 Оплата заказа' % (id,), 'Покупатель']
+
+    def yookassa_lines():
+        yield ['ЮKassa', 'Отчёт о платежах', '', '', '', '', '', '']
+        yield ['Идентификатор', 'Магазин', 'Дата платежа', 'Статус', 'Способ', 'Сумма платежа', 'Валюта', 'Описание заказа']
+        for (id, marker, amount, day) in orders:
+            if marker != 'YANDEX-JS' or random_state.random() < 0.01:
+                continue
+            status = 'Оплачен' if random_state.random() > 0.02 else 'Отменен'
+            yield ['2d%x' % (id,), '1', day.isoformat(), status, 'bank_card', '%.2f' % amount, 'RUB', id]
+
+    benchmark_write_xlsx(names[0], jivo_rows())
+    benchmark_write_csv(names[1], 'cp1251', alfabank_lines())
+    benchmark_write_csv(names[2], 'utf-8', yookassa_lines())
+    return names
+
+def benchmark_generate_registers(data, size):
+    names = [benchmark_path(data, size, name) for name in ('primary.xlsx', 'copy.xlsx')]
+    if not benchmark_needs(*names):
+        return names
+
+    random_state = random.Random(BENCHMARK_SEED * 3 + size)
+    ids = list(range(1, size + 1))
+
+    for (name, dropped) in zip(names, (0.001, 0.002)):
+        def register_rows():
+            yield ['Значение 1', 'Значение 2', 'Номер документа']
+            for id in ids:
+                first = 'v%d' % (id,) if random_state.random() > dropped else ''
+                second = 'v%d' % (id,) if random_state.random() > dropped else ''
+                number = '%09d' % (id,) if random_state.random() > dropped else '^%09d' % (id,)
+                yield [first, second, number]
+
+        benchmark_write_xlsx(name, register_rows())
+
+    return names
+
+def benchmark_generate_transactions(data, size):
+    return benchmark_generate_registers(data, size)
+
+def benchmark_generate_simple(data, size):
+    return benchmark_generate_registers(data, size)[:1]
+
+def benchmark_generate_sixtytwo(data, size):
+    names = [benchmark_path(data, size, name) for name in ('62_1.xlsx', '62_2.xlsx')]
+    if not benchmark_needs(*names):
+        return names
+
+    random_state = random.Random(BENCHMARK_SEED * 5 + size)
+    customers = [('ООО "Контрагент %d"' % (ic,), '77%08d' % (ic,) if ic % 5 else '') for ic in range(0, size)]
+
+    for (name, changed) in zip(names, (0.0, 0.01)):
+        def ledger_rows():
+            yield ['Оборотно-сальдовая ведомость по счету 62']
+            yield ['Период: 2024 г.']
+            yield ['Выводимые данные: БУ (данные бухгалтерского учета)']
+            yield ['']
+            yield ['']
+            yield ['Счет', '', 'ИНН', 'Сальдо на начало периода', '', 'Обороты за период', '', 'Сальдо на конец периода']
+            yield ['Контрагенты', '', '', 'Дебет', 'Кредит', 'Дебет', 'Кредит', 'Дебет', 'Кредит']
+            yield ['62']
+            yield ['']
+            for (ic, (customer, inn)) in enumerate(customers):
+                if random_state.random() < changed:
+                    continue
+                amounts = [float(ic % 1000 * 10 + column) for column in range(0, 6)]
+                if random_state.random() < changed:
+                    amounts[2] += 1
+                yield [customer, '', inn] + amounts
+            yield ['Итого']
+
+        benchmark_write_xlsx(name, ledger_rows())
+
+    return names
+
+def benchmark_generate_dzo(data, size):
+    name = benchmark_path(data, size, 'payments.csv')
+    if not benchmark_needs(name):
+        return [name]
+
+    random_state = random.Random(BENCHMARK_SEED * 7 + size)
+
+    def payment_lines():
+        for id in range(1, size + 1):
+            activated = benchmark_day(random_state)
+            since = activated + timedelta(days=random_state.randrange(0, 30))
+            till = since + timedelta(days=random_state.randrange(28, 730))
+            system = 'SBS' if random_state.random() < 0.8 else 'OTH'
+            yield [id, activated.isoformat(), system, '%.2f' % (random_state.randrange(1000, 500000) / 100,), since.isoformat(), till.isoformat()]
+
+    benchmark_write_csv(name, 'utf-8', payment_lines())
+    return [name]
+
+BENCHMARK_GENERATORS = {
+    'banking': benchmark_generate_banking,
+    'transactions': benchmark_generate_transactions,
+    'simple': benchmark_generate_simple,
+    'sixtytwo': benchmark_generate_sixtytwo,
+    'dzo': benchmark_generate_dzo,
+}
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
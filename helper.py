@@ -1,28 +1,59 @@
 #!/usr/bin/python
 
-from ast import arg
-from cmath import sin
 import sys
 import os
 from enum import Enum
-from chardet import detect
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
-from calendar import monthrange
-import xlrd
-import xlwings
+from datetime import date, datetime, timedelta
 import csv
-import string
+import io
+import contextlib
+import copy
+import math
+import concurrent.futures
+import functools
+import hashlib
+import heapq
+import operator
+import pickle
+import re
+import time
+from xml.etree import ElementTree
+from xml.parsers import expat
+from itertools import compress, groupby, islice
+from array import array
+from bisect import bisect_left
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 def main(argv):
+    argv = common_parse_options(argv)
     if not argv:
-        main_help()
-    
+        if not common_options.cache_cleared:
+            main_help()
+        return
+
+    try:
+        main_procedure(argv)
+    except Common_LoadError as error:
+        print('Not readable:', error)
+        print()
+    finally:
+        if common_options.profile:
+            common_profile_report()
+
+def main_procedure(argv):
     match argv[0]:
         case '--learn':
             main_learn()
         case '--banking':
             main_banking(argv[1:])
+        case '--banking-batch':
+            main_banking_batch(argv[1:])
+        case '--watch':
+            main_banking_watch(argv[1:])
         case '--transactions':
             main_transactions(argv[1:])
         case '--simple':
@@ -31,6 +62,8 @@ def main(argv):
             main_sixtytwo(argv[1:])
         case '--dzo':
             main_dzo(argv[1:])
+        case '--history':
+            main_history(argv[1:])
         case _:
             print('Unknown procedure')
             print()
@@ -59,6 +92,18 @@ def main_help():
     print('Use for comparing Jivo, Alfa, and YooKassa:')
     print('python helper.py --banking jivo.xlsx alfa.csv yookassa.csv')
     print()
+    print('Use for reconciling Jivo orders with AlfaBank and YooKassa payments by amount and date,')
+    print('with the amount tolerance and the date window in days:')
+    print('python helper.py --banking --reconcile --tolerance 0.01 --window 3 jivo.xlsx alfa.csv yookassa.csv')
+    print()
+    print('Use for comparing many Jivo, Alfa, and YooKassa triples at once,')
+    print('grouped by directory or listed as "group;jivo;alfa;yookassa" lines in a manifest:')
+    print('python helper.py --banking-batch quarter_dir_or_manifest.csv')
+    print()
+    print('Use for watching an inbox directory and writing a fresh banking report into its')
+    print('"reports" subdirectory whenever Jivo, Alfa, or YooKassa files appear or change:')
+    print('python helper.py --watch --interval 1 --reports reports_dir inbox_dir')
+    print()
     print('Use for comparing internal documents about realisation:')
     print('python helper.py --transactions primary.xls copy.xls')
     print()
@@ -68,53 +113,1439 @@ def main_help():
     print('Use for comparing internal documents by simple:')
     print('python helper.py --simple doc.xls')
     print()
+    print('Use for comparing any columns of one document at once, as "A:B" pairs,')
+    print('"A:B:C" groups compared pairwise, or "Sheet!A" columns of other sheets,')
+    print('where a sheet prefix also applies to the later columns of the same pair or group:')
+    print('python helper.py --simple doc.xls A:B C:D:E Sheet2!A:B Sheet2!C:Sheet3!C')
+    print()
+    print('Every --banking, --banking-batch, --watch, --transactions, and --62 run is recorded')
+    print('into a local history, where a run only closes the items left open by earlier runs')
+    print('over the same directory of inputs or the same --banking-batch group; use for listing')
+    print('the items that are still unmatched, how old they are, what was unmatched within a period,')
+    print('the recorded runs, or the 62 differences:')
+    print('python helper.py --history open --source AlfaBank --min-age 90')
+    print('python helper.py --history period --since 01.07.2026 --till 30.09.2026')
+    print('python helper.py --history runs --procedure banking')
+    print('python helper.py --history differences --since 01.09.2026')
+    print()
     print('Use for generating the DZO block:')
     print('python helper.py --dzo ru doc.xls payments.csv')
     print()
+    print('Use for generating the DZO block without Excel, confirming automatically:')
+    print('python helper.py --dzo --headless --yes ru doc.xlsx payments.csv')
+    print()
+    print('Use --values to write precomputed amounts or --direct for non-volatile formulas,')
+    print('and --verify to check the precomputed amounts against the formula without writing;')
+    print('--verify compares two Python copies of the formula rules and does not evaluate it in Excel:')
+    print('python helper.py --dzo --values ru doc.xls payments.csv')
+    print()
+    print('Use --incremental to append only new payments and rewrite only the changed ones:')
+    print('python helper.py --dzo --incremental ru doc.xls payments.csv')
+    print()
+    print('Global options, placed before the procedure:')
+    print('--no-cache       parse every input file again, bypassing the cache')
+    print('--clear-cache    remove all cached parsing results')
+    print('--external       compare --transactions and --simple through sorted runs on disk')
+    print('--memory-budget  megabytes kept in memory by --external before spilling, 256 by default')
+    print('--profile        print time, rows and peak memory of every phase to stderr as a table,')
+    print('                 or as JSON lines with --profile=json')
+    print('--no-history     do not record the run into the history')
+    print('--history-db     history database path, "alexsa_buh/history.sqlite3" in XDG_DATA_HOME by default')
+    print()
+
+COMMON_EXTERNAL_BUDGET = 256 * 1024 * 1024
+
+class Common_Options:
+    def __init__(self):
+        self.cache = True
+        self.cache_cleared = False
+        self.external = False
+        self.memory_budget = COMMON_EXTERNAL_BUDGET
+        self.profile = None
+        self.history = True
+        self.history_path = None
+
+common_options = Common_Options()
+
+def common_parse_options(argv):
+    while argv:
+        match argv[0]:
+            case '--no-cache':
+                common_options.cache = False
+            case '--clear-cache':
+                common_cache_clear()
+                common_options.cache_cleared = True
+                print('Cache cleared')
+                print()
+            case '--external':
+                common_options.external = True
+            case '--memory-budget':
+                common_options.memory_budget = int(argv[1]) * 1024 * 1024
+                argv = argv[1:]
+            case '--profile' | '--profile=table':
+                common_profile_start(COMMON_PROFILE_TABLE)
+            case '--profile=json':
+                common_profile_start(COMMON_PROFILE_JSON)
+            case '--no-history':
+                common_options.history = False
+            case '--history-db':
+                common_options.history_path = argv[1]
+                argv = argv[1:]
+            case _:
+                break
+
+        argv = argv[1:]
+
+    return argv
+
+COMMON_PROFILE_TABLE = 'table'
+COMMON_PROFILE_JSON = 'json'
+
+class Common_Phase:
+    def __init__(self, name, source):
+        self.name = name
+        self.source = os.path.basename(str(source)) if source else ''
+        self.rows = 0
+        self.seconds = 0.0
+        self.peak = 0
+
+    def __enter__(self):
+        common_phases.append(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        self.seconds = time.perf_counter() - self.started
+        self.peak = common_peak_memory()
+
+    def add(self, rows):
+        self.rows += rows
+
+class Common_NoPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        pass
+
+    def add(self, rows):
+        pass
+
+common_phases = list()
+common_no_phase = Common_NoPhase()
+
+def common_phase(name, source=None):
+    if common_options.profile:
+        return Common_Phase(name, source)
+    else:
+        return common_no_phase
+
+def common_profile_start(mode):
+    import tracemalloc
+
+    common_options.profile = mode
+    if resource is None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def common_profile_take():
+    phases = list(common_phases)
+    common_phases.clear()
+    return phases
+
+def common_process_start():
+    # forked workers must not report the phases their parent recorded before the fork
+    common_phases.clear()
+
+def common_peak_memory():
+    if resource is None:
+        import tracemalloc
+
+        return tracemalloc.get_traced_memory()[1]
+
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def common_count_rows(result):
+    if isinstance(result, tuple):
+        return sum([common_count_rows(item) for item in result])
+    elif isinstance(result, dict) and result and isinstance(next(iter(result.values())), set):
+        return sum([len(values) for values in result.values()])
+
+    try:
+        return len(result)
+    except TypeError:
+        return 0
+
+def common_profile_report():
+    import json
+
+    phases = common_profile_take()
+
+    if common_options.profile == COMMON_PROFILE_JSON:
+        for phase in phases:
+            print(json.dumps({
+                'phase': phase.name,
+                'source': phase.source,
+                'seconds': round(phase.seconds, 6),
+                'rows': phase.rows,
+                'rows_per_sec': round(phase.rows / phase.seconds) if phase.seconds and phase.rows else None,
+                'peak_mb': round(phase.peak / 1024 / 1024, 1),
+            }, ensure_ascii=False), file=sys.stderr)
+        return
+
+    print('%-8s %-32s %10s %12s %12s %9s' % ('phase', 'source', 'seconds', 'rows', 'rows/s', 'peak MB'), file=sys.stderr)
+    for phase in phases:
+        speed = '%12.0f' % (phase.rows / phase.seconds,) if phase.seconds and phase.rows else '%12s' % ('-',)
+        print('%-8s %-32s %10.3f %12d %s %9.1f' % (phase.name, phase.source[:32], phase.seconds, phase.rows, speed, phase.peak / 1024 / 1024), file=sys.stderr)
+    print(file=sys.stderr)
+
+COMMON_PROCESS_THRESHOLD = 4 * 1024 * 1024
+
+class Common_LoadError(Exception):
+    def __init__(self, name, error):
+        super().__init__('%s (%s)' % (name, error))
+        self.name = name
+
+def common_source_name(source):
+    return source.name if isinstance(source, Common_FileMeta) else source
+
+def common_prefers_process(name):
+    if common_file_extension(name) not in ('.xls', '.xlsx'):
+        return False
+
+    try:
+        return os.path.getsize(name) >= COMMON_PROCESS_THRESHOLD
+    except OSError:
+        return False
+
+def common_load_job(function, source, args, options):
+    common_options.__dict__.update(options.__dict__)
+    result = function(source, *args)
+    return (result, common_profile_take())
+
+def common_load_all(jobs):
+    threads = concurrent.futures.ThreadPoolExecutor()
+    processes = None
+    futures = list()
+
+    for (function, source, *args) in jobs:
+        name = common_source_name(source)
+        if common_prefers_process(name):
+            if not processes:
+                processes = concurrent.futures.ProcessPoolExecutor(initializer=common_process_start)
+            if isinstance(source, Common_FileMeta):
+                source.close()
+            futures.append((name, True, processes.submit(common_load_job, function, source, args, common_options)))
+        else:
+            futures.append((name, False, threads.submit(function, source, *args)))
+
+    try:
+        results = list()
+        for (name, remote, future) in futures:
+            try:
+                result = future.result()
+            except Exception as error:
+                raise Common_LoadError(name, error) from error
+
+            if remote:
+                (result, phases) = result
+                common_phases.extend(phases)
+            results.append(result)
+
+        return results
+    finally:
+        threads.shutdown(cancel_futures=True)
+        if processes:
+            processes.shutdown(cancel_futures=True)
+
+COMMON_CACHE_LIMIT = 512 * 1024 * 1024
+COMMON_CACHE_SUFFIX = '.pickle'
+COMMON_HASH_CHUNK = 1024 * 1024
+
+def common_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'alexsa_buh')
+
+common_hashes = dict()
+
+def common_hash_file(name):
+    stat = os.stat(name)
+    key = (os.path.abspath(name), stat.st_mtime_ns, stat.st_size)
+    if key in common_hashes:
+        return common_hashes[key]
+
+    digest = hashlib.blake2b(digest_size=20)
+    with open(name, 'rb') as file:
+        while chunk := file.read(COMMON_HASH_CHUNK):
+            digest.update(chunk)
+
+    common_hashes[key] = digest.hexdigest()
+    return common_hashes[key]
+
+def common_cache_entries():
+    directory = common_cache_dir()
+    if not os.path.isdir(directory):
+        return list()
+
+    entries = list()
+    for entry in os.scandir(directory):
+        if entry.name.endswith(COMMON_CACHE_SUFFIX):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    return entries
+
+def common_cache_clear():
+    for (mtime, size, path) in common_cache_entries():
+        os.remove(path)
+
+def common_cache_load(path):
+    try:
+        with open(path, 'rb') as file:
+            result = pickle.load(file)
+    except Exception:
+        return (False, None)
+
+    with contextlib.suppress(OSError):
+        os.utime(path)
+    return (True, result)
+
+def common_cache_store(path, result):
+    # the result is already parsed, so a cache that cannot be written only costs the next run
+    temporary = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary, 'wb') as file:
+            pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+    except OSError as error:
+        print('Not cached:', error, file=sys.stderr)
+        with contextlib.suppress(OSError):
+            os.remove(temporary)
+        return
+
+    entries = sorted(common_cache_entries())
+    total_size = sum([size for (mtime, size, path) in entries])
+    for (mtime, size, path) in entries:
+        if total_size <= COMMON_CACHE_LIMIT:
+            break
+
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_size -= size
+
+def common_cached(tag, version):
+    def _decorate(function):
+        @functools.wraps(function)
+        def _wrapper(source, *args):
+            name = source.name if isinstance(source, Common_FileMeta) else source
+            if not common_options.cache:
+                with common_phase('parse', name) as phase:
+                    result = function(source, *args)
+                    phase.add(common_count_rows(result))
+                return result
+
+            key = '-'.join([tag, str(version), common_hash_file(name)])
+            if args:
+                key += '-' + hashlib.blake2b(repr(args).encode(), digest_size=8).hexdigest()
+            path = os.path.join(common_cache_dir(), key + COMMON_CACHE_SUFFIX)
+
+            with common_phase('cache', name) as phase:
+                (found, result) = common_cache_load(path)
+                if found:
+                    phase.add(common_count_rows(result))
+            if found:
+                if isinstance(source, Common_FileMeta):
+                    source.close()
+                return result
+
+            with common_phase('parse', name) as phase:
+                result = function(source, *args)
+                phase.add(common_count_rows(result))
+            common_cache_store(path, result)
+            return result
+
+        return _wrapper
+
+    return _decorate
+
+COMMON_HISTORY_NAME = 'history.sqlite3'
+COMMON_HISTORY_VERSION = 1
+COMMON_HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    procedure TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    started TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS inputs (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    source TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    item TEXT NOT NULL,
+    PRIMARY KEY (run_id, source, direction, item)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS open_items (
+    procedure TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    source TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    item TEXT NOT NULL,
+    since TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    PRIMARY KEY (procedure, scope, source, direction, item)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS differences (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    first_customer TEXT,
+    second_customer TEXT,
+    first_name TEXT,
+    second_name TEXT,
+    label TEXT,
+    first_value TEXT,
+    second_value TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS runs_procedure ON runs (procedure, scope, started);
+CREATE INDEX IF NOT EXISTS inputs_run ON inputs (run_id);
+CREATE INDEX IF NOT EXISTS inputs_hash ON inputs (hash);
+CREATE INDEX IF NOT EXISTS items_item ON items (source, direction, item);
+CREATE INDEX IF NOT EXISTS open_items_since ON open_items (since);
+CREATE INDEX IF NOT EXISTS open_items_source ON open_items (source, direction, since);
+CREATE INDEX IF NOT EXISTS differences_run ON differences (run_id);
+CREATE INDEX IF NOT EXISTS differences_customer ON differences (first_customer);
+"""
+
+def common_history_path():
+    if common_options.history_path:
+        return common_options.history_path
+
+    base = os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(base, 'alexsa_buh', COMMON_HISTORY_NAME)
+
+def common_history_connect():
+    import sqlite3
+
+    path = common_history_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA synchronous = NORMAL')
+    connection.execute('PRAGMA foreign_keys = ON')
+    if connection.execute('PRAGMA user_version').fetchone()[0] < COMMON_HISTORY_VERSION:
+        connection.executescript(COMMON_HISTORY_SCHEMA)
+        connection.execute('PRAGMA user_version = %d' % (COMMON_HISTORY_VERSION,))
+
+    return connection
+
+def common_history_now():
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+def common_history_scope(names):
+    # runs over the inputs of one directory, usually one entity or period, close each other's items
+    directories = [os.path.dirname(os.path.abspath(name)) for name in names]
+    return os.path.commonpath(directories) if directories else ''
+
+def common_history_errors():
+    import sqlite3
+
+    return (OSError, sqlite3.Error)
+
+class Common_History:
+    def __init__(self, procedure, scope, inputs):
+        self.procedure = procedure
+        self.scope = scope
+        self.inputs = inputs
+        self.pending = list()
+        self.connection = None
+
+    def __enter__(self):
+        self.started = common_history_now()
+        try:
+            self.connection = common_history_connect()
+            self.run_id = self.connection.execute(
+                'INSERT INTO runs (procedure, scope, started) VALUES (?, ?, ?)',
+                (self.procedure, self.scope, self.started),
+            ).lastrowid
+            self.connection.executemany(
+                'INSERT INTO inputs (run_id, kind, name, hash) VALUES (?, ?, ?, ?)',
+                [(self.run_id, kind, os.path.abspath(name), common_hash_file(name)) for (kind, name) in self.inputs],
+            )
+        except common_history_errors() as error:
+            self.fail(error)
+
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        if not self.connection:
+            return
+
+        try:
+            if kind is None:
+                self.flush()
+                self.close_items()
+                self.connection.commit()
+            else:
+                self.connection.rollback()
+        except common_history_errors() as failure:
+            self.fail(failure)
+        finally:
+            if self.connection:
+                self.connection.close()
+
+    def fail(self, error):
+        print('History not recorded:', error, file=sys.stderr)
+        if self.connection:
+            self.connection.close()
+        self.connection = None
+        self.pending.clear()
+
+    def spill(self):
+        if len(self.pending) >= COMMON_EXTERNAL_BATCH:
+            try:
+                self.flush()
+            except common_history_errors() as error:
+                self.fail(error)
+
+    def add_items(self, source, direction, items):
+        for item in items:
+            if not self.connection:
+                return
+
+            self.pending.append((self.run_id, source, direction, str(item)))
+            self.spill()
+
+    def track(self, source, directions, entries):
+        for (value, side) in entries:
+            if self.connection:
+                self.pending.append((self.run_id, source, directions[side], str(value)))
+                self.spill()
+            yield value
+
+    def add_difference(self, kind, first, second, label=None, first_value=None, second_value=None):
+        if not self.connection:
+            return
+
+        try:
+            self.connection.execute(
+                'INSERT INTO differences (run_id, kind, first_customer, first_name, second_customer, second_name, label, first_value, second_value) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.run_id, kind, *first, *second, label, first_value, second_value),
+            )
+        except common_history_errors() as error:
+            self.fail(error)
+
+    def flush(self):
+        self.connection.executemany('INSERT OR IGNORE INTO items (run_id, source, direction, item) VALUES (?, ?, ?, ?)', self.pending)
+        self.pending.clear()
+
+    def close_items(self):
+        self.connection.execute(
+            'DELETE FROM open_items WHERE procedure = ? AND scope = ? AND NOT EXISTS ('
+            'SELECT 1 FROM items WHERE items.run_id = ? AND items.source = open_items.source '
+            'AND items.direction = open_items.direction AND items.item = open_items.item)',
+            (self.procedure, self.scope, self.run_id),
+        )
+        self.connection.execute(
+            'INSERT INTO open_items (procedure, scope, source, direction, item, since, run_id) '
+            'SELECT ?, ?, source, direction, item, ?, run_id FROM items WHERE run_id = ? '
+            'ON CONFLICT DO UPDATE SET run_id = excluded.run_id',
+            (self.procedure, self.scope, self.started, self.run_id),
+        )
+
+class Common_NoHistory:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        pass
+
+    def add_items(self, source, direction, items):
+        pass
+
+    def track(self, source, directions, entries):
+        for (value, side) in entries:
+            yield value
+
+    def add_difference(self, kind, first, second, label=None, first_value=None, second_value=None):
+        pass
+
+common_no_history = Common_NoHistory()
+
+def common_history(procedure, scope, inputs):
+    if common_options.history:
+        return Common_History(procedure, scope, inputs)
+    else:
+        return common_no_history
+
+COMMON_DETECT_CHUNK = 4096
+COMMON_DETECT_LIMIT = 64 * 1024
+COMMON_HEADER_ROWS = 10
 
 class Common_FileMeta:
-    def __init__(self, kind, name, encoding):
+    def __init__(self, kind, name, encoding, handle=None, rows=None):
         self.kind = kind
         self.name = name
         self.encoding = encoding
+        self.handle = handle
+        self.rows = rows if rows else list()
+
+    def take(self):
+        handle = self.handle
+        self.handle = None
+        return handle if handle else common_open_handle(self.name)
+
+    def close(self):
+        if self.handle:
+            self.handle.close()
+            self.handle = None
 
 class Common_FileKind(Enum):
     UNKNOWN = 0
     JIVO = 1
     ALFABANK = 2
     YOOKASSA = 3
+    SIXTYTWO = 4
+    DZO = 5
+
+class Common_FileHeader:
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+
+    def cell(self, row, column):
+        if row >= len(self.rows) or column >= len(self.rows[row]):
+            return ''
+        else:
+            return self.rows[row][column]
+
+common_recognizers = dict()
+
+def common_recognizer(kind, *extensions):
+    def _register(function):
+        for extension in extensions:
+            common_recognizers.setdefault(extension, list()).append((kind, function))
+        return function
+
+    return _register
+
+@common_recognizer(Common_FileKind.JIVO, '.xlsx', '.xls')
+def common_recognize_jivo(header):
+    return str(header.cell(0, 0)).find('Есть файлы') > -1
+
+@common_recognizer(Common_FileKind.SIXTYTWO, '.xls', '.xlsx')
+def common_recognize_sixtytwo(header):
+    for row in header.rows[:9]:
+        for value in row:
+            if isinstance(value, str) and value.lower().find('ведомость') > -1 and value.find('62') > -1:
+                return True
+
+    return False
+
+@common_recognizer(Common_FileKind.ALFABANK, '.csv')
+def common_recognize_alfabank(header):
+    return header.cell(0, 0).find('Наименование предприятия') > -1
+
+@common_recognizer(Common_FileKind.YOOKASSA, '.csv')
+def common_recognize_yookassa(header):
+    return header.cell(0, 0).find('ЮKassa') > -1
+
+@common_recognizer(Common_FileKind.DZO, '.csv')
+def common_recognize_dzo(header):
+    try:
+        int(header.cell(0, 0))
+        datetime.strptime(header.cell(0, 1), '%Y-%m-%d')
+        return len(header.rows[0]) >= 6
+    except ValueError:
+        return False
+
+def common_file_extension(name):
+    return os.path.splitext(name)[1].lower()
+
+def common_open_handle(name):
+    if common_file_extension(name) == '.csv':
+        return open(name, 'rb')
+    else:
+        return common_open_sheet(name)
+
+def common_open_text(meta):
+    return io.TextIOWrapper(meta.take(), encoding=meta.encoding, newline='')
+
+def common_detect_encoding(file):
+    from chardet import UniversalDetector
+
+    detector = UniversalDetector()
+    prefix = bytearray()
+
+    while len(prefix) < COMMON_DETECT_LIMIT and not detector.done:
+        chunk = file.read(COMMON_DETECT_CHUNK)
+        if not chunk:
+            break
+
+        prefix += chunk
+        detector.feed(chunk)
+
+    detector.close()
+    return (detector.result['encoding'] or 'utf-8', bytes(prefix))
+
+def common_read_csv_header(file):
+    (encoding, prefix) = common_detect_encoding(file)
+    file.seek(0)
+
+    lines = prefix.decode(encoding, errors='ignore').splitlines()
+    if len(prefix) == COMMON_DETECT_LIMIT:
+        lines = lines[:-1]
+
+    rows = list(csv.reader(lines[:COMMON_HEADER_ROWS], delimiter=';'))
+    return (encoding, rows)
+
+def common_read_sheet_header(sheet):
+    rows = list()
+    for row in sheet.iter_rows():
+        rows.append(row)
+        if len(rows) == COMMON_HEADER_ROWS:
+            break
+
+    return rows
 
 def common_recognize_file(name):
-    with open(name, 'rb') as file:
-        data = file.read()
-        encoding = detect(data)['encoding']
-
-    if name.endswith('.xlsx'):
-        workbook = xlrd.open_workbook(name)
-        worksheet = workbook.sheet_by_index(0)
-        marker = worksheet.cell_value(0, 0)
-
-        if marker.find('Есть файлы') > -1:
-            return Common_FileMeta(Common_FileKind.JIVO, name, encoding)
-        else :
-            return Common_FileMeta(Common_FileKind.UNKNOWN, name, encoding)
-    elif name.endswith('.csv'):
-        with open(name, encoding=encoding) as file:
-            document = csv.reader(file, delimiter=';')
-            first_line = next(document)
-            columns = list(first_line)
-            marker = columns[0]
-
-            if marker.find('Наименование предприятия') > -1:
-                return Common_FileMeta(Common_FileKind.ALFABANK, name, encoding)
-            elif marker.find('ЮKassa') > -1:
-                return Common_FileMeta(Common_FileKind.YOOKASSA, name, encoding)
+    recognizers = common_recognizers.get(common_file_extension(name))
+    if not recognizers:
+        return None
+
+    with common_phase('detect', name):
+        handle = common_open_handle(name)
+        if isinstance(handle, io.IOBase):
+            (encoding, rows) = common_read_csv_header(handle)
+        else:
+            (encoding, rows) = (None, common_read_sheet_header(handle))
+
+    header = Common_FileHeader(name, rows)
+    for (kind, recognize) in recognizers:
+        if recognize(header):
+            return Common_FileMeta(kind, name, encoding, handle, rows)
+
+    handle.close()
+    return Common_FileMeta(Common_FileKind.UNKNOWN, name, encoding)
+
+COMMON_CSV_CHUNK = 1024 * 1024
+COMMON_CSV_ENCODING_PROBE = ';\r\n".0123456789'
+
+def common_is_ascii_compatible(encoding):
+    try:
+        return COMMON_CSV_ENCODING_PROBE.encode(encoding) == COMMON_CSV_ENCODING_PROBE.encode('ascii')
+    except LookupError:
+        return False
+
+def common_csv_pattern(encoding, columns, where, width, partial=False):
+    field = b'[^;\r\n]*+'
+    end = b'(?=[;\r\n]|$)'
+    parts = [re.escape(where[ic].encode(encoding)) if ic in where else b'(' + field + b')' if ic in columns else field for ic in range(0, width)]
+
+    last = max(where.keys(), default=width - 1) if partial else width - 1
+    if last == width - 1:
+        return re.compile(b'^' + b';'.join(parts) + end, re.MULTILINE)
+
+    # the columns after the last where column become optional, the delimiter before the last one
+    # is captured on its own and stays empty for the rows that end early
+    tail = b''.join([b';' + part for part in parts[last + 1:-1]]) + b'(;)' + parts[-1]
+    return re.compile(b'^' + b';'.join(parts[:last + 1]) + end + b'(?:' + tail + end + b')?', re.MULTILINE)
+
+def common_csv_decode(values, encoding):
+    return b'\n'.join(values).decode(encoding).split('\n')
+
+def common_csv_match(pattern, data, encoding, count, positions, short):
+    matches = pattern.findall(data)
+    if not matches:
+        return
+
+    fields = list(zip(*matches)) if pattern.groups > 1 else [matches]
+    if len(fields) > count:
+        present = fields.pop(-2)
+        if b'' in present:
+            rows = list(zip(*fields))
+            short.extend([tuple([row[position].decode(encoding) for position in positions]) for (row, delimiter) in zip(rows, present) if not delimiter])
+            fields = list(zip(*[row for (row, delimiter) in zip(rows, present) if delimiter]))
+            if not fields:
+                return
+
+    fields = [common_csv_decode(values, encoding) for values in fields]
+    yield from zip(*[fields[position] for position in positions])
+
+def common_csv_project(rows, columns, where, width, short):
+    last = max(where.keys(), default=width - 1)
+    for row in rows:
+        if len(row) <= last or not all([row[ic] == value for (ic, value) in where.items()]):
+            continue
+        elif len(row) >= width:
+            yield tuple([row[ic] for ic in columns])
+        elif short is not None:
+            short.append(tuple([row[ic] if ic < len(row) else '' for ic in columns]))
+
+class Common_CsvLines:
+    def __init__(self, lines, file, encoding):
+        self.lines = lines
+        self.file = file
+        self.encoding = encoding
+        self.pending = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        # a quoted field may run past the chunk, the rest of it is read line by line
+        if self.pending is not None:
+            (line, self.pending) = (self.pending, None)
+            return line
+
+        line = next(self.lines, None)
+        if line is None:
+            line = self.file.readline().decode(self.encoding)
+            if not line:
+                raise StopIteration
+
+        return line
+
+def common_scan_csv(meta, columns, where=None, short=None):
+    where = where if where else dict()
+    width = max(list(columns) + list(where.keys())) + 1
+
+    if not common_is_ascii_compatible(meta.encoding):
+        with meta.take() as file:
+            rows = csv.reader(io.TextIOWrapper(file, encoding=meta.encoding, newline=''), delimiter=';')
+            yield from common_csv_project(rows, columns, where, width, short)
+        return
+
+    encoding = meta.encoding
+    pattern = common_csv_pattern(encoding, columns, where, width, short is not None)
+    order = sorted(set(columns))
+    positions = [order.index(ic) for ic in columns]
+
+    with meta.take() as file:
+        remainder = b''
+        while True:
+            chunk = file.read(COMMON_CSV_CHUNK)
+            data = remainder + chunk
+
+            quote = data.find(b'"')
+            if quote < 0:
+                cut = data.rfind(b'\n') + 1 if chunk else len(data)
+                (data, remainder) = (data[:cut], data[cut:])
+                yield from common_csv_match(pattern, data, encoding, len(order), positions, short)
+            else:
+                # only the records holding quotes go through csv, which may read on past this chunk
+                data += file.readline()
+                remainder = b''
+                start = data.rfind(b'\n', 0, quote) + 1
+                yield from common_csv_match(pattern, data[:start], encoding, len(order), positions, short)
+
+                lines = io.StringIO(data[start:].decode(encoding), newline='')
+                source = Common_CsvLines(lines, file, encoding)
+                rows = csv.reader(source, delimiter=';')
+                plain = list()
+                for line in lines:
+                    if '"' not in line:
+                        plain.append(line)
+                        continue
+
+                    if plain:
+                        yield from common_csv_match(pattern, ''.join(plain).encode(encoding), encoding, len(order), positions, short)
+                        plain.clear()
+
+                    source.pending = line
+                    yield from common_csv_project(islice(rows, 1), columns, where, width, short)
+                yield from common_csv_match(pattern, ''.join(plain).encode(encoding), encoding, len(order), positions, short)
+
+            if not chunk:
+                break
+
+COMMON_XLSX_MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+COMMON_XLSX_RELS_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+COMMON_XLSX_PACKAGE_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+COMMON_XLSX_ROW = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main row'
+COMMON_XLSX_CELL = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main c'
+COMMON_XLSX_VALUE = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main v'
+COMMON_XLSX_TEXT = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main t'
+COMMON_XLSX_PHONETIC = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main rPh'
+COMMON_XLSX_CHUNK = 64 * 1024
+
+def common_open_sheet(name, sheet=None):
+    with common_phase('open', name):
+        if common_file_extension(name) == '.xlsx':
+            return Common_XlsxSheet(name, sheet)
+        else:
+            return Common_XlsSheet(name, sheet)
+
+def common_project_row(row, columns):
+    if columns is None:
+        return row
+    else:
+        return [row[ic] if ic < len(row) else '' for ic in columns]
+
+class Common_XlsSheet:
+    def __init__(self, name, sheet=None):
+        self.name = name
+        import xlrd
+
+        self.workbook = xlrd.open_workbook(name, on_demand=True)
+        self.worksheet = None
+        self.select(sheet)
+
+    def select(self, sheet):
+        if self.worksheet is not None:
+            self.workbook.unload_sheet(self.worksheet.name)
+
+        if sheet is None:
+            self.worksheet = self.workbook.sheet_by_index(0)
+        else:
+            self.worksheet = self.workbook.sheet_by_name(sheet)
+
+    def iter_rows(self, columns=None, start=0):
+        for ir in range(start, self.worksheet.nrows):
+            yield common_project_row(self.worksheet.row_values(ir), columns)
+
+    def columns(self, indices, start=0):
+        values = list()
+        for ic in indices:
+            if ic < self.worksheet.ncols:
+                values.append(self.worksheet.col_values(ic, start))
+            else:
+                values.append([''] * max(self.worksheet.nrows - start, 0))
+
+        return values
+
+    def close(self):
+        self.workbook.release_resources()
+
+class Common_XlsxSheet:
+    def __init__(self, name, sheet=None):
+        self.name = name
+        import zipfile
+
+        self.archive = zipfile.ZipFile(name)
+        self.path = None
+        self.strings = None
+        self.select(sheet)
+
+    def select(self, sheet):
+        self.path = self._find_sheet(sheet)
+
+    def _find_sheet(self, name):
+        workbook = ElementTree.fromstring(self.archive.read('xl/workbook.xml'))
+        sheets = workbook.findall('%ssheets/%ssheet' % (COMMON_XLSX_MAIN_NS, COMMON_XLSX_MAIN_NS))
+        if name is None:
+            sheet = sheets[0]
+        else:
+            matches = [sheet for sheet in sheets if sheet.get('name') == name]
+            if not matches:
+                raise KeyError('No sheet named %s' % (name,))
+            sheet = matches[0]
+
+        relations = ElementTree.fromstring(self.archive.read('xl/_rels/workbook.xml.rels'))
+        for relation in relations.iter('%sRelationship' % COMMON_XLSX_PACKAGE_NS):
+            if relation.get('Id') == sheet.get('%sid' % COMMON_XLSX_RELS_NS):
+                target = relation.get('Target')
+                return target.lstrip('/') if target.startswith('/') else 'xl/' + target
+
+        return 'xl/worksheets/sheet1.xml'
+
+    def _load_strings(self):
+        strings = list()
+        if 'xl/sharedStrings.xml' not in self.archive.namelist():
+            return strings
+
+        with self.archive.open('xl/sharedStrings.xml') as stream:
+            for (event, element) in ElementTree.iterparse(stream):
+                if element.tag == COMMON_XLSX_MAIN_NS + 'si':
+                    strings.append(common_xlsx_text(element))
+                    element.clear()
+
+        return strings
+
+    def iter_rows(self, columns=None, start=0):
+        if self.strings is None:
+            self.strings = self._load_strings()
+
+        parser = Common_XlsxRowParser(self.strings, columns, start)
+        with self.archive.open(self.path) as stream:
+            while True:
+                chunk = stream.read(COMMON_XLSX_CHUNK)
+                parser.feed(chunk)
+                yield from parser.rows
+                parser.rows.clear()
+
+                if not chunk:
+                    break
+
+    def columns(self, indices, start=0):
+        values = [list() for ic in indices]
+        for row in self.iter_rows(columns=indices, start=start):
+            for (column, value) in zip(values, row):
+                column.append(value)
+
+        return values
+
+    def close(self):
+        self.archive.close()
+
+class Common_XlsxRowParser:
+    def __init__(self, strings, columns, start):
+        self.strings = strings
+        self.columns = columns
+        self.wanted = set(columns) if columns is not None else None
+        self.start = start
+        self.rows = list()
+        self.index = 0
+        self.values = dict()
+        self.column = -1
+        self.kind = None
+        self.texts = None
+        self.capture = False
+        self.phonetic = False
+
+        self.parser = expat.ParserCreate(namespace_separator=' ')
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self._start
+        self.parser.EndElementHandler = self._end
+        self.parser.CharacterDataHandler = self._text
+
+    def feed(self, chunk):
+        self.parser.Parse(chunk, not chunk)
+
+    def _start(self, tag, attributes):
+        if tag == COMMON_XLSX_CELL:
+            reference = attributes.get('r')
+            self.column = common_xlsx_column_index(reference) if reference else self.column + 1
+            if self.wanted is None or self.column in self.wanted:
+                self.kind = attributes.get('t', 'n')
+                self.texts = list()
+        elif self.texts is not None and (tag == COMMON_XLSX_VALUE or tag == COMMON_XLSX_TEXT):
+            self.capture = not self.phonetic
+        elif tag == COMMON_XLSX_PHONETIC:
+            self.phonetic = True
+        elif tag == COMMON_XLSX_ROW:
+            reference = attributes.get('r')
+            row_index = int(reference) - 1 if reference else self.index
+            while self.index < row_index:
+                self._emit()
+            self.column = -1
+
+    def _end(self, tag):
+        if tag == COMMON_XLSX_CELL:
+            if self.texts is not None:
+                self.values[self.column] = common_xlsx_value(self.kind, ''.join(self.texts), self.strings)
+                self.texts = None
+        elif tag == COMMON_XLSX_VALUE or tag == COMMON_XLSX_TEXT:
+            self.capture = False
+        elif tag == COMMON_XLSX_PHONETIC:
+            self.phonetic = False
+        elif tag == COMMON_XLSX_ROW:
+            self._emit()
+
+    def _text(self, text):
+        if self.capture:
+            self.texts.append(text)
+
+    def _emit(self):
+        if self.index >= self.start:
+            values = self.values
+            if self.columns is None:
+                self.rows.append([values.get(ic, '') for ic in range(0, max(values) + 1 if values else 0)])
             else:
-                return Common_FileMeta(Common_FileKind.UNKNOWN, name, encoding)
+                self.rows.append([values.get(ic, '') for ic in self.columns])
+
+        self.values = dict()
+        self.index += 1
+
+def common_column_letter(index):
+    letters = str()
+    index += 1
+    while index:
+        (index, remainder) = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+
+    return letters
+
+def common_xlsx_column_index(reference):
+    index = 0
+    for char in reference:
+        if char <= '9':
+            break
+        index = index * 26 + ord(char) - 64
+
+    return index - 1
+
+def common_xlsx_text(element):
+    texts = list()
+    for child in element.iter():
+        if child.tag == COMMON_XLSX_MAIN_NS + 'rPh':
+            break
+        elif child.tag == COMMON_XLSX_MAIN_NS + 't' and child.text:
+            texts.append(child.text)
+
+    return ''.join(texts)
+
+def common_xlsx_value(kind, value, strings):
+    if kind == 'inlineStr' or kind == 'str':
+        return value
+    elif not value:
+        return ''
+    elif kind == 's':
+        return strings[int(value)]
+    elif kind == 'n':
+        return float(value)
+    elif kind == 'b':
+        return int(value)
     else:
+        return value
+
+def common_is_blank(value):
+    return not value
+
+def common_is_blank_or_hidden(value):
+    return not value or value.startswith('^')
+
+COMMON_ORDER_SET_SHIFT = 16
+COMMON_ORDER_SET_MASK = (1 << COMMON_ORDER_SET_SHIFT) - 1
+COMMON_ORDER_SET_CHUNK_BYTES = (1 << COMMON_ORDER_SET_SHIFT) // 8
+COMMON_ORDER_SET_SPARSE_LIMIT = 4096
+COMMON_ORDER_SET_BITS = tuple([tuple([ib for ib in range(0, 8) if byte >> ib & 1]) for byte in range(0, 256)])
+
+def common_order_set_bitmap(lows):
+    bitmap = bytearray(COMMON_ORDER_SET_CHUNK_BYTES)
+    for low in lows:
+        bitmap[low >> 3] |= 1 << (low & 7)
+
+    return bitmap
+
+def common_order_set_lows(chunk):
+    data = chunk.to_bytes(COMMON_ORDER_SET_CHUNK_BYTES, 'little')
+    for ib in compress(range(0, COMMON_ORDER_SET_CHUNK_BYTES), data):
+        offset = ib << 3
+        for bit in COMMON_ORDER_SET_BITS[data[ib]]:
+            yield offset + bit
+
+def common_order_set_dense(chunk):
+    return chunk if isinstance(chunk, int) else int.from_bytes(common_order_set_bitmap(chunk), 'little')
+
+def common_order_set_chunk(chunk):
+    # a range keeps a bitmap only while it holds enough ids to pay for its 8 KB
+    if isinstance(chunk, int):
+        return chunk if chunk.bit_count() > COMMON_ORDER_SET_SPARSE_LIMIT else array('H', common_order_set_lows(chunk))
+    else:
+        return chunk if len(chunk) <= COMMON_ORDER_SET_SPARSE_LIMIT else common_order_set_dense(chunk)
+
+class Common_OrderSet:
+    def __init__(self, ids=()):
+        builder = Common_OrderSetBuilder()
+        builder.extend(ids)
+        self.chunks = builder.chunks()
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        result = cls()
+        for (high, chunk) in chunks.items():
+            chunk = common_order_set_chunk(chunk)
+            if chunk:
+                result.chunks[high] = chunk
+
+        return result
+
+    def difference(self, other):
+        chunks = dict()
+        for (high, chunk) in self.chunks.items():
+            other_chunk = other.chunks.get(high)
+            if other_chunk is None:
+                chunks[high] = chunk
+            elif isinstance(chunk, int):
+                chunks[high] = chunk & ~common_order_set_dense(other_chunk)
+            elif isinstance(other_chunk, int):
+                data = other_chunk.to_bytes(COMMON_ORDER_SET_CHUNK_BYTES, 'little')
+                chunks[high] = array('H', [low for low in chunk if not data[low >> 3] >> (low & 7) & 1])
+            else:
+                excluded = set(other_chunk)
+                chunks[high] = array('H', [low for low in chunk if low not in excluded])
+
+        return Common_OrderSet.from_chunks(chunks)
+
+    def union(self, other):
+        chunks = dict(self.chunks)
+        for (high, chunk) in other.chunks.items():
+            own_chunk = chunks.get(high)
+            if own_chunk is None:
+                chunks[high] = chunk
+            elif isinstance(own_chunk, int) or isinstance(chunk, int):
+                chunks[high] = common_order_set_dense(own_chunk) | common_order_set_dense(chunk)
+            else:
+                chunks[high] = array('H', sorted(set(own_chunk).union(chunk)))
+
+        return Common_OrderSet.from_chunks(chunks)
+
+    __sub__ = difference
+    __or__ = union
+
+    def __contains__(self, id):
+        chunk = self.chunks.get(id >> COMMON_ORDER_SET_SHIFT)
+        low = id & COMMON_ORDER_SET_MASK
+        if chunk is None:
+            return False
+        elif isinstance(chunk, int):
+            return bool(chunk >> low & 1)
+        else:
+            index = bisect_left(chunk, low)
+            return index < len(chunk) and chunk[index] == low
+
+    def __len__(self):
+        return sum([chunk.bit_count() if isinstance(chunk, int) else len(chunk) for chunk in self.chunks.values()])
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __eq__(self, other):
+        return isinstance(other, Common_OrderSet) and self.chunks == other.chunks
+
+    def __iter__(self):
+        for high in sorted(self.chunks):
+            chunk = self.chunks[high]
+            base = high << COMMON_ORDER_SET_SHIFT
+            for low in common_order_set_lows(chunk) if isinstance(chunk, int) else chunk:
+                yield base + low
+
+class Common_OrderSetBuilder:
+    def __init__(self):
+        self.sparse = dict()
+        self.dense = dict()
+
+    def add(self, id):
+        high = id >> COMMON_ORDER_SET_SHIFT
+        bitmap = self.dense.get(high)
+        if bitmap is not None:
+            bitmap[(id & COMMON_ORDER_SET_MASK) >> 3] |= 1 << (id & 7)
+        else:
+            lows = self.sparse.get(high)
+            if lows is None:
+                lows = self.sparse[high] = array('H')
+
+            lows.append(id & COMMON_ORDER_SET_MASK)
+            if len(lows) > COMMON_ORDER_SET_SPARSE_LIMIT:
+                self.dense[high] = common_order_set_bitmap(lows)
+                del self.sparse[high]
+
+    def extend(self, ids):
+        (sparse, dense) = (self.sparse, self.dense)
+        (high, lows, bitmap) = (None, None, None)
+        for id in ids:
+            if id >> COMMON_ORDER_SET_SHIFT != high:
+                high = id >> COMMON_ORDER_SET_SHIFT
+                bitmap = dense.get(high)
+                if bitmap is None:
+                    lows = sparse.get(high)
+                    if lows is None:
+                        lows = sparse[high] = array('H')
+
+            if bitmap is not None:
+                bitmap[(id & COMMON_ORDER_SET_MASK) >> 3] |= 1 << (id & 7)
+            else:
+                lows.append(id & COMMON_ORDER_SET_MASK)
+                if len(lows) > COMMON_ORDER_SET_SPARSE_LIMIT:
+                    bitmap = dense[high] = common_order_set_bitmap(lows)
+                    del sparse[high]
+
+    def chunks(self):
+        chunks = {high: common_order_set_chunk(array('H', sorted(set(lows)))) for (high, lows) in self.sparse.items()}
+        for (high, bitmap) in self.dense.items():
+            chunks[high] = common_order_set_chunk(int.from_bytes(bitmap, 'little'))
+
+        return chunks
+
+    def build(self):
+        return Common_OrderSet.from_chunks(self.chunks())
+
+COMMON_EXTERNAL_BATCH = 4096
+COMMON_EXTERNAL_ITEM_OVERHEAD = 16
+
+def common_stream_column(name, column, skip, sheet_name=None):
+    sheet = common_open_sheet(name, sheet_name)
+    try:
+        for (value,) in sheet.iter_rows(columns=[column], start=1):
+            if not skip(value):
+                yield value
+    finally:
+        sheet.close()
+
+def common_unique(values):
+    previous = last = object()
+    for value in values:
+        if previous is last or value != previous:
+            yield value
+        previous = value
+
+def common_external_spill(values, directory):
+    import tempfile
+
+    values.sort()
+    with tempfile.NamedTemporaryFile('wb', dir=directory, suffix='.run', delete=False) as file:
+        batch = list()
+        for value in common_unique(values):
+            batch.append(value)
+            if len(batch) == COMMON_EXTERNAL_BATCH:
+                pickle.dump(batch, file, pickle.HIGHEST_PROTOCOL)
+                batch = list()
+        if batch:
+            pickle.dump(batch, file, pickle.HIGHEST_PROTOCOL)
+
+        return file.name
+
+def common_external_read(path):
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                batch = pickle.load(file)
+            except EOFError:
+                break
+
+            yield from batch
+
+    os.remove(path)
+
+def common_external_sorted(values, directory, budget):
+    runs = list()
+    (chunk, size) = (list(), 0)
+    for value in values:
+        chunk.append(value)
+        size += sys.getsizeof(value) + COMMON_EXTERNAL_ITEM_OVERHEAD
+        if size >= budget:
+            runs.append(common_external_spill(chunk, directory))
+            (chunk, size) = (list(), 0)
+
+    if not runs:
+        chunk.sort()
+        return common_unique(chunk)
+    elif chunk:
+        runs.append(common_external_spill(chunk, directory))
+
+    return common_unique(heapq.merge(*[common_external_read(run) for run in runs]))
+
+def common_symmetric_difference(first, second):
+    end = object()
+    (first_value, second_value) = (next(first, end), next(second, end))
+
+    while first_value is not end and second_value is not end:
+        if first_value < second_value:
+            yield (first_value, 0)
+            first_value = next(first, end)
+        elif second_value < first_value:
+            yield (second_value, 1)
+            second_value = next(second, end)
+        else:
+            (first_value, second_value) = (next(first, end), next(second, end))
+
+    for (side, value, rest) in ((0, first_value, first), (1, second_value, second)):
+        if value is not end:
+            yield (value, side)
+            for value in rest:
+                yield (value, side)
+
+def common_external_diff(first_values, second_values, sides=False):
+    import tempfile
+
+    budget = common_options.memory_budget // 2
+    with tempfile.TemporaryDirectory(prefix='alexsa_buh_') as directory:
+        first = common_external_sorted(first_values, directory, budget)
+        second = common_external_sorted(second_values, directory, budget)
+        if sides:
+            yield from common_symmetric_difference(first, second)
+        else:
+            for (value, side) in common_symmetric_difference(first, second):
+                yield value
+
+def common_merge_join(first, second):
+    end = (object(), None)
+    ((first_key, first_value), (second_key, second_value)) = (next(first, end), next(second, end))
+
+    while first_key is not end[0] or second_key is not end[0]:
+        if second_key is end[0] or (first_key is not end[0] and first_key < second_key):
+            yield (first_key, first_value, None)
+            (first_key, first_value) = next(first, end)
+        elif first_key is end[0] or second_key < first_key:
+            yield (second_key, None, second_value)
+            (second_key, second_value) = next(second, end)
+        else:
+            yield (first_key, first_value, second_value)
+            ((first_key, first_value), (second_key, second_value)) = (next(first, end), next(second, end))
+
+def common_print_entries(title, entries, empty):
+    found = False
+    for entry in entries:
+        if not found:
+            print(title)
+            found = True
+        print('-', entry)
+
+    if not found:
+        print(empty)
+    print()
+
+COMMON_EXCEL_EPOCH = date(1899, 12, 30)
+COMMON_DATE_FORMATS = ('%d.%m.%Y', '%Y-%m-%d', '%d.%m.%y')
+
+def common_find_header_column(rows, keywords):
+    for keyword in keywords:
+        for row in rows:
+            for (ic, value) in enumerate(row):
+                if isinstance(value, str) and value.lower().find(keyword) > -1:
+                    return ic
+
+    return None
+
+def common_parse_amount(value):
+    if not isinstance(value, str):
+        return float(value)
+
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    try:
+        return float(value.replace('\xa0', '').replace(' ', '').replace(',', '.'))
+    except ValueError:
         return None
 
+def common_parse_day(value):
+    if isinstance(value, str):
+        return common_parse_day_text(value)
+    elif isinstance(value, datetime):
+        return value.date().toordinal()
+    elif isinstance(value, date):
+        return value.toordinal()
+    else:
+        return (COMMON_EXCEL_EPOCH + timedelta(days=int(value))).toordinal()
+
+@functools.lru_cache(maxsize=4096)
+def common_parse_day_text(value):
+    text = value.strip().split(' ')[0].split('T')[0]
+    for format in COMMON_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, format).toordinal()
+        except ValueError:
+            continue
+
+    return None
+
 def common_calc_date_diff(date_fst, date_snd):
+    from dateutil.relativedelta import relativedelta
+
     delta = relativedelta(date_snd, date_fst)
     return delta.years * 12 + delta.months
 
@@ -149,7 +1580,38 @@ def common_excel_comment(lang, comment):
     signature = signatures.get(lang, 'N')
     return '%s("%s") + ' % (signature, comment)
 
+MAIN_BANKING_TOLERANCE = 0.01
+MAIN_BANKING_WINDOW = 3
+
+class MainBanking_Options:
+    def __init__(self):
+        self.reconcile = False
+        self.tolerance = MAIN_BANKING_TOLERANCE
+        self.window = MAIN_BANKING_WINDOW
+
+def main_banking_parse_options(argv):
+    options = MainBanking_Options()
+
+    while argv:
+        match argv[0]:
+            case '--reconcile':
+                options.reconcile = True
+            case '--tolerance':
+                options.tolerance = float(argv[1].replace(',', '.'))
+                argv = argv[1:]
+            case '--window':
+                options.window = int(argv[1])
+                argv = argv[1:]
+            case _:
+                break
+
+        argv = argv[1:]
+
+    return (options, argv)
+
 def main_banking(argv):
+    (options, argv) = main_banking_parse_options(argv)
+
     jivo_meta = None
     alfabank_meta = None
     yookassa_meta = None
@@ -170,209 +1632,1155 @@ def main_banking(argv):
             yookassa_meta = meta
         else:
             print('Not recognized:', name)
+            meta.close()
     
     print()
-    
-    alfabank_orders = main_banking_find_alfabank_orders(alfabank_meta)
-    yookassa_orders = main_banking_find_yookassa_orders(yookassa_meta)
-    main_banking_compare_orders(jivo_meta, alfabank_orders, yookassa_orders)
 
-def main_banking_find_alfabank_orders(meta):
-    with open(meta.name, encoding=meta.encoding) as file:
-        document = csv.reader(file, delimiter=';')
+    if options.reconcile:
+        results = main_banking_reconcile(options, jivo_meta, alfabank_meta, yookassa_meta)
+        diffs = [(source, name, [id for (id, found, expected) in rows]) for (source, (counts, details)) in results for (name, rows) in details.items()]
+        main_banking_record('reconcile', None, [jivo_meta, alfabank_meta, yookassa_meta], diffs)
+        return
 
-        orders = set()
-        for row in document:
-            id = row[15].split('.')[0]
-            if not id:
-                continue
+    (alfabank_orders, yookassa_orders, (alfabank_found_orders, yookassa_found_orders)) = common_load_all([
+        (main_banking_find_alfabank_orders, alfabank_meta),
+        (main_banking_find_yookassa_orders, yookassa_meta),
+        (main_banking_find_jivo_orders, jivo_meta),
+    ])
 
-            orders.add(int(id))
+    diffs = main_banking_compare_orders(alfabank_found_orders, yookassa_found_orders, alfabank_orders, yookassa_orders)
+    main_banking_record('banking', None, [jivo_meta, alfabank_meta, yookassa_meta], diffs)
+
+@common_cached('alfabank', 4)
+def main_banking_find_alfabank_orders(meta):
+    return Common_OrderSet(main_banking_scan_alfabank_orders(meta))
+
+def main_banking_scan_alfabank_orders(meta):
+    for (description,) in common_scan_csv(meta, (15,)):
+        id = description.split('.')[0]
+        if not id:
+            continue
 
-        return orders
+        yield int(id)
 
+@common_cached('yookassa', 4)
 def main_banking_find_yookassa_orders(meta):
-    with open(meta.name, encoding=meta.encoding) as file:
-        document = csv.reader(file, delimiter=';')
+    return Common_OrderSet(main_banking_scan_yookassa_orders(meta))
 
-        orders = set()
-        for row in document:
-            id = row[7]
-            if not id:
-                continue
-            elif id == 'Описание заказа':
-                continue
-            
-            status = row[3]
-            if not status == 'Оплачен':
+def main_banking_scan_yookassa_orders(meta):
+    for (id,) in common_scan_csv(meta, (7,), where={3: 'Оплачен'}):
+        if not id:
+            continue
+        elif id == 'Описание заказа':
+            continue
+
+        yield int(id)
+
+@common_cached('jivo', 3)
+def main_banking_find_jivo_orders(meta):
+    sheet = meta.take()
+    builders = [Common_OrderSetBuilder() for marker in MAIN_BANKING_MARKERS]
+
+    try:
+        for (id, extra) in sheet.iter_rows(columns=[2, 13], start=1):
+            if common_is_blank(id):
                 continue
 
-            orders.add(int(id))
+            (id, extra) = (int(id), str(extra))
+            for (builder, marker) in zip(builders, MAIN_BANKING_MARKERS):
+                if marker in extra:
+                    builder.add(id)
+                    break
+    finally:
+        sheet.close()
 
-        return orders
+    return tuple([builder.build() for builder in builders])
 
-def main_banking_compare_orders(meta, alfabank_expected_orders, yookassa_expected_orders):
-    workbook = xlrd.open_workbook(meta.name)
-    worksheet = workbook.sheet_by_index(0)
+def main_banking_compare_orders(alfabank_found_orders, yookassa_found_orders, alfabank_expected_orders, yookassa_expected_orders):
+    with common_phase('compare') as phase:
+        diffs = main_banking_diff_orders(alfabank_found_orders, yookassa_found_orders, alfabank_expected_orders, yookassa_expected_orders)
+        phase.add(common_count_rows((alfabank_found_orders, yookassa_found_orders, alfabank_expected_orders, yookassa_expected_orders)))
 
-    alfabank_found_orders = set()
-    yookassa_found_orders = set()
-    total_diff_num = 0
+    with common_phase('report'):
+        main_banking_print_diffs(diffs)
 
-    for i in range(1, worksheet.nrows):
-        id = worksheet.cell_value(i, 2)
-        if not id:
-            continue
+    return diffs
 
-        extra = worksheet.cell_value(i, 13)
-        if extra.find('ALFA-BANK') > -1:
-            alfabank_found_orders.add(int(id))
-        elif extra.find('YANDEX-JS') > -1:
-            yookassa_found_orders.add(int(id))
-    
-    alfabank_ours_diff = alfabank_expected_orders.difference(alfabank_found_orders)
-    total_diff_num += len(alfabank_ours_diff)
-    if alfabank_ours_diff:
-        print('AlfaBank, these orders were found within BANK system only:')
-        for id in sorted(alfabank_ours_diff):
-            print('-', id)
-        print()
-    
-    alfabank_theirs_diff = alfabank_found_orders.difference(alfabank_expected_orders)
-    total_diff_num += len(alfabank_theirs_diff)
-    if alfabank_theirs_diff:
-        print('AlfaBank, these orders were found within JIVO system only:')
-        for id in sorted(alfabank_theirs_diff):
-            print('-', id)
-        print()
+def main_banking_record(procedure, scope, metas, diffs):
+    inputs = [(meta.kind.name.lower(), meta.name) for meta in metas if meta]
+    if scope is None:
+        scope = common_history_scope([name for (kind, name) in inputs])
 
-    yookassa_ours_diff = yookassa_expected_orders.difference(yookassa_found_orders)
-    total_diff_num += len(yookassa_ours_diff)
-    if yookassa_ours_diff:
-        print('YooKassa, these orders were found within BANK system only:')
-        for id in sorted(yookassa_ours_diff):
-            print('-', id)
-        print()
-    
-    yookassa_theirs_diff = yookassa_found_orders.difference(yookassa_expected_orders)
-    total_diff_num += len(yookassa_theirs_diff)
-    if yookassa_theirs_diff:
-        print('YooKassa, these orders were found within JIVO system only:')
-        for id in sorted(yookassa_theirs_diff):
-            print('-', id)
-        print()
+    with common_history(procedure, scope, inputs) as history:
+        for (source, system, ids) in diffs:
+            history.add_items(source, system, ids)
+
+def main_banking_diff_orders(alfabank_found_orders, yookassa_found_orders, alfabank_expected_orders, yookassa_expected_orders):
+    return [
+        ('AlfaBank', 'BANK', alfabank_expected_orders.difference(alfabank_found_orders)),
+        ('AlfaBank', 'JIVO', alfabank_found_orders.difference(alfabank_expected_orders)),
+        ('YooKassa', 'BANK', yookassa_expected_orders.difference(yookassa_found_orders)),
+        ('YooKassa', 'JIVO', yookassa_found_orders.difference(yookassa_expected_orders)),
+    ]
+
+def main_banking_print_diffs(diffs):
+    total_diff_num = 0
+
+    for (source, system, ids) in diffs:
+        total_diff_num += len(ids)
+        if ids:
+            print('%s, these orders were found within %s system only:' % (source, system))
+            for id in ids:
+                print('-', id)
+            print()
 
     if not total_diff_num:
         print('No issues found')
         print()
 
-def main_transactions(argv):
-    first_orders = main_transactions_find_orders(argv[0])
-    second_orders = main_transactions_find_orders(argv[1])
+MAIN_BANKING_MARKERS = ('ALFA-BANK', 'YANDEX-JS')
+MAIN_BANKING_PAID_STATUS = 'Оплачен'
+MAIN_BANKING_AMOUNT_KEYWORDS = ('сумма платежа', 'сумма', 'приход', 'стоимость', 'amount')
+MAIN_BANKING_DATE_KEYWORDS = ('дата оплаты', 'дата платежа', 'дата операции', 'дата', 'date')
+MAIN_BANKING_CLASSES = ('matched', 'amount-mismatch', 'date-mismatch', 'missing')
+
+class MainBanking_Layout:
+    def __init__(self, rows, id_column, extra=()):
+        self.id_column = id_column
+        self.amount_column = common_find_header_column(rows, MAIN_BANKING_AMOUNT_KEYWORDS)
+        self.date_column = common_find_header_column(rows, MAIN_BANKING_DATE_KEYWORDS)
+        self.extra = tuple(extra)
+
+    def columns(self):
+        amount_column = self.id_column if self.amount_column is None else self.amount_column
+        date_column = self.id_column if self.date_column is None else self.date_column
+        return (self.id_column, amount_column, date_column) + self.extra
+
+    def record(self, id, row, amount, day, status=None):
+        amount = None if self.amount_column is None or common_is_blank(amount) else common_parse_amount(amount)
+        day = None if self.date_column is None or common_is_blank(day) else common_parse_day(day)
+        return (id, row, amount, day, status)
+
+def main_banking_scan_jivo_payments(meta):
+    layout = MainBanking_Layout(meta.rows[:1], 2, (13,))
+    sheet = meta.take()
+
+    try:
+        for (row, (id, amount, day, key)) in enumerate(sheet.iter_rows(columns=layout.columns(), start=1)):
+            if common_is_blank(id) or not isinstance(key, str):
+                continue
+
+            for marker in MAIN_BANKING_MARKERS:
+                if marker in key:
+                    yield (marker, layout.record(int(id), row, amount, day))
+                    break
+    finally:
+        sheet.close()
+
+def main_banking_scan_alfabank_payments(meta):
+    layout = MainBanking_Layout(meta.rows, 15)
+    for (row, (description, amount, day)) in enumerate(common_scan_csv(meta, layout.columns())):
+        id = description.split('.')[0]
+        if not id.isdigit():
+            continue
+
+        yield layout.record(int(id), row, amount, day)
+
+def main_banking_scan_yookassa_payments(meta):
+    layout = MainBanking_Layout(meta.rows, 7, (3,))
+    for (row, (id, amount, day, status)) in enumerate(common_scan_csv(meta, layout.columns())):
+        if not id.isdigit():
+            continue
+
+        yield layout.record(int(id), row, amount, day, status)
+
+def main_banking_accumulate(entries, record):
+    (id, row, amount, day, status) = record
+    entry = entries.get(id)
+    if entry is None:
+        entry = entries[id] = [False, None, None, None]
+
+    entry[3] = status
+    entry[0] = status is None or status == MAIN_BANKING_PAID_STATUS
+    if entry[0]:
+        if amount is not None:
+            entry[1] = amount if entry[1] is None else entry[1] + amount
+        if day is not None:
+            entry[2] = day if entry[2] is None else max(entry[2], day)
+
+def main_banking_collect_entries(records):
+    entries = dict()
+    for record in records:
+        main_banking_accumulate(entries, record)
+
+    return entries
+
+def main_banking_group_entries(records):
+    for (id, group) in groupby(records, key=operator.itemgetter(0)):
+        yield (id, main_banking_collect_entries(group)[id])
+
+@common_cached('jivo-payments', 1)
+def main_banking_find_jivo_payments(meta):
+    entries = {marker: dict() for marker in MAIN_BANKING_MARKERS}
+    for (marker, record) in main_banking_scan_jivo_payments(meta):
+        main_banking_accumulate(entries[marker], record)
+
+    return tuple([entries[marker] for marker in MAIN_BANKING_MARKERS])
+
+@common_cached('alfabank-payments', 1)
+def main_banking_find_alfabank_payments(meta):
+    return main_banking_collect_entries(main_banking_scan_alfabank_payments(meta))
+
+@common_cached('yookassa-payments', 1)
+def main_banking_find_yookassa_payments(meta):
+    return main_banking_collect_entries(main_banking_scan_yookassa_payments(meta))
+
+def main_banking_reconcile(options, jivo_meta, alfabank_meta, yookassa_meta):
+    sources = (
+        ('AlfaBank', MAIN_BANKING_MARKERS[0], alfabank_meta, main_banking_scan_alfabank_payments),
+        ('YooKassa', MAIN_BANKING_MARKERS[1], yookassa_meta, main_banking_scan_yookassa_payments),
+    )
+
+    results = list()
+    if common_options.external:
+        for (source, marker, meta, scan) in sources:
+            with common_phase('compare', source):
+                result = main_banking_reconcile_external(options, jivo_meta, marker, meta, scan)
+            with common_phase('report', source):
+                main_banking_print_reconciliation(source, result)
+            results.append((source, result))
+        return results
+
+    (alfabank_entries, yookassa_entries, jivo_entries) = common_load_all([
+        (main_banking_find_alfabank_payments, alfabank_meta),
+        (main_banking_find_yookassa_payments, yookassa_meta),
+        (main_banking_find_jivo_payments, jivo_meta),
+    ])
+
+    for ((source, marker, meta, scan), found_entries, expected_entries) in zip(sources, jivo_entries, (alfabank_entries, yookassa_entries)):
+        with common_phase('compare', source) as phase:
+            ids = sorted(set(found_entries.keys()).union(expected_entries.keys()))
+            joined = ((id, found_entries.get(id), expected_entries.get(id)) for id in ids)
+            result = main_banking_classify(options, joined)
+            phase.add(len(ids))
+
+        with common_phase('report', source):
+            main_banking_print_reconciliation(source, result)
+        results.append((source, result))
+
+    return results
+
+def main_banking_reconcile_external(options, jivo_meta, marker, meta, scan):
+    import tempfile
+
+    budget = common_options.memory_budget // 2
+    with tempfile.TemporaryDirectory(prefix='alexsa_buh_') as directory:
+        records = (record for (found_marker, record) in main_banking_scan_jivo_payments(jivo_meta) if found_marker == marker)
+        found = common_external_sorted(records, directory, budget)
+        expected = common_external_sorted(scan(meta), directory, budget)
+        joined = common_merge_join(main_banking_group_entries(found), main_banking_group_entries(expected))
+        return main_banking_classify(options, joined)
+
+def main_banking_classify(options, joined):
+    counts = dict.fromkeys(MAIN_BANKING_CLASSES, 0)
+    details = {name: list() for name in MAIN_BANKING_CLASSES[1:]}
+
+    for (id, found, expected) in joined:
+        if expected is not None and not expected[0]:
+            if found is None:
+                continue
+            name = 'missing'
+        elif found is None or expected is None:
+            name = 'missing'
+        elif found[1] is not None and expected[1] is not None and abs(found[1] - expected[1]) > options.tolerance + 1e-9:
+            name = 'amount-mismatch'
+        elif found[2] is not None and expected[2] is not None and abs(found[2] - expected[2]) > options.window:
+            name = 'date-mismatch'
+        else:
+            name = 'matched'
+
+        counts[name] += 1
+        if name in details:
+            details[name].append((id, found, expected))
+
+    return (counts, details)
+
+def main_banking_format_entry(entry):
+    if entry is None:
+        return 'none'
+
+    (paid, amount, day, status) = entry
+    text = '%s on %s' % ('-' if amount is None else '%.2f' % amount, '-' if day is None else date.fromordinal(day).strftime('%d.%m.%Y'))
+    return text if paid or not status else '%s (%s)' % (text, status)
+
+def main_banking_print_reconciliation(source, result):
+    (counts, details) = result
+
+    print('%s reconciliation: %s' % (source, ', '.join(['%s %d' % (name, counts[name]) for name in MAIN_BANKING_CLASSES])))
+    print()
+
+    for (name, rows) in details.items():
+        if rows:
+            print('%s, %s:' % (source, name))
+            for (id, found, expected) in rows:
+                print('- %d: JIVO %s, BANK %s' % (id, main_banking_format_entry(found), main_banking_format_entry(expected)))
+            print()
 
-    first_diff = first_orders.difference(second_orders)
-    second_diff = second_orders.difference(first_orders)
-    total_diff = first_diff.union(second_diff)
+class MainBanking_Group:
+    def __init__(self, name, scope):
+        self.name = name
+        self.scope = scope
+        self.metas = dict()
+
+    def is_complete(self):
+        return all([kind in self.metas for kind in MAIN_BANKING_GROUP_KINDS])
 
-    if total_diff:
-        print('Please check these orders:')
-        for id in sorted(total_diff):
-            print('-', id.lstrip('0'))
+MAIN_BANKING_GROUP_KINDS = (Common_FileKind.JIVO, Common_FileKind.ALFABANK, Common_FileKind.YOOKASSA)
+
+def main_banking_batch(argv):
+    groups = main_banking_batch_groups(argv[0])
+    print()
+
+    with concurrent.futures.ProcessPoolExecutor(initializer=common_process_start) as executor:
+        tasks = [(group, common_options) for group in groups]
+        results = list()
+        for ((name, diffs, phases), group) in zip(executor.map(main_banking_batch_worker, tasks), groups):
+            results.append((name, diffs))
+            common_phases.extend(phases)
+            main_banking_record('banking', group.scope, group.metas.values(), diffs)
+
+    if not results:
+        print('No complete groups found')
         print()
-    else:
-        print('No issues found')
+        return
+
+    print('Summary:')
+    for (name, diffs) in results:
+        counts = ['%s/%s %d' % (source, system, len(ids)) for (source, system, ids) in diffs]
+        print('- %s: %s' % (name, ', '.join(counts)))
+    print()
+
+    for (name, diffs) in results:
+        print('Group %s:' % (name,))
         print()
+        main_banking_print_diffs(diffs)
+
+def main_banking_batch_groups(path):
+    sources = dict()
+    scopes = dict()
+
+    if os.path.isdir(path):
+        for (directory, subdirectories, names) in os.walk(path):
+            subdirectories.sort()
+            group_name = os.path.relpath(directory, path)
+            scopes[group_name] = os.path.abspath(directory)
+            for name in sorted(names):
+                sources.setdefault(group_name, list()).append(os.path.join(directory, name))
+    else:
+        with open(path, encoding='utf-8', newline='') as file:
+            for row in csv.reader(file, delimiter=';'):
+                if not row or not row[0] or row[0].startswith('#'):
+                    continue
+
+                # groups of one manifest may share a directory, so each keeps its own scope
+                scopes[row[0]] = '%s#%s' % (os.path.abspath(path), row[0])
+                for name in row[1:]:
+                    if name:
+                        sources.setdefault(row[0], list()).append(os.path.join(os.path.dirname(path), name))
+
+    groups = list()
+    for (group_name, names) in sources.items():
+        group = MainBanking_Group(group_name, scopes[group_name])
+        for name in names:
+            meta = common_recognize_file(name)
+            if not meta:
+                continue
 
-def main_transactions_find_orders(name):
-    workbook = xlrd.open_workbook(name)
-    worksheet = workbook.sheet_by_index(0)
+            meta.close()
+            if meta.kind not in MAIN_BANKING_GROUP_KINDS:
+                continue
+            elif meta.kind in group.metas:
+                print('Ambiguous %s in %s: %s' % (meta.kind.name.lower(), group_name, name))
+            else:
+                group.metas[meta.kind] = meta
+
+        if group.is_complete():
+            print('Group %s: %s' % (group_name, ', '.join([group.metas[kind].name for kind in MAIN_BANKING_GROUP_KINDS])))
+            groups.append(group)
+        elif group.metas:
+            print('Incomplete group %s: skipped' % (group_name,))
+
+    return groups
+
+def main_banking_batch_worker(task):
+    (group, options) = task
+    common_options.__dict__.update(options.__dict__)
+
+    alfabank_orders = main_banking_find_alfabank_orders(group.metas[Common_FileKind.ALFABANK])
+    yookassa_orders = main_banking_find_yookassa_orders(group.metas[Common_FileKind.YOOKASSA])
+    (alfabank_found_orders, yookassa_found_orders) = main_banking_find_jivo_orders(group.metas[Common_FileKind.JIVO])
+
+    with common_phase('compare', group.name):
+        diffs = main_banking_diff_orders(alfabank_found_orders, yookassa_found_orders, alfabank_orders, yookassa_orders)
+
+    return (group.name, diffs, common_profile_take())
+
+MAIN_BANKING_WATCH_INTERVAL = 1.0
+MAIN_BANKING_WATCH_REPORTS = 'reports'
+MAIN_BANKING_WATCH_LOADERS = {
+    Common_FileKind.JIVO: main_banking_find_jivo_orders,
+    Common_FileKind.ALFABANK: main_banking_find_alfabank_orders,
+    Common_FileKind.YOOKASSA: main_banking_find_yookassa_orders,
+}
+MAIN_BANKING_WATCH_TITLES = {
+    Common_FileKind.JIVO: 'Jivo',
+    Common_FileKind.ALFABANK: 'AlfaBank',
+    Common_FileKind.YOOKASSA: 'YooKassa',
+}
+
+class MainBanking_WatchOptions:
+    def __init__(self):
+        self.interval = MAIN_BANKING_WATCH_INTERVAL
+        self.reports = None
+        self.once = False
+
+def main_banking_watch_parse_options(argv):
+    options = MainBanking_WatchOptions()
+
+    while argv:
+        match argv[0]:
+            case '--interval':
+                options.interval = float(argv[1])
+                argv = argv[1:]
+            case '--reports':
+                options.reports = argv[1]
+                argv = argv[1:]
+            case '--once':
+                options.once = True
+            case _:
+                break
+
+        argv = argv[1:]
+
+    return (options, argv)
+
+class MainBanking_WatchFile:
+    def __init__(self, name, signature, kind=None, orders=None):
+        self.name = name
+        self.signature = signature
+        self.kind = kind
+        self.orders = orders
 
-    orders = set()
+class MainBanking_Watch:
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = dict()
+        self.indexes = dict()
 
-    for i in range(1, worksheet.nrows):
-        id = worksheet.cell_value(i, 2)
-        if not id:
-            continue
+    def scan(self):
+        changed = set()
+        seen = set()
 
-        if id.startswith('^'):
-            continue
+        for entry in sorted(os.scandir(self.directory), key=lambda entry: entry.name):
+            if not entry.is_file():
+                continue
 
-        orders.add(id)
-    
-    return orders
+            seen.add(entry.path)
+            stat = entry.stat()
+            signature = (stat.st_mtime_ns, stat.st_size)
+            known = self.files.get(entry.path)
+            if known and known.signature == signature:
+                continue
 
-def main_simple(argv):
-    first_values = main_simple_find_values(argv[0], 0)
-    second_values = main_simple_find_values(argv[0], 1)
+            if known and known.kind:
+                changed.add(known.kind)
+
+            watched = main_banking_watch_load(entry.path, signature)
+            self.files[entry.path] = watched
+            if watched.kind:
+                print('Updated %s: %s' % (MAIN_BANKING_WATCH_TITLES[watched.kind], entry.name))
+                changed.add(watched.kind)
+
+        for name in [name for name in self.files if name not in seen]:
+            watched = self.files.pop(name)
+            if watched.kind:
+                print('Removed %s: %s' % (MAIN_BANKING_WATCH_TITLES[watched.kind], os.path.basename(name)))
+                changed.add(watched.kind)
 
-    first_diff = first_values.difference(second_values)
-    second_diff = second_values.difference(first_values)
-    total_diff = first_diff.union(second_diff)
+        for kind in changed:
+            self.indexes[kind] = self.merge(kind)
 
-    if total_diff:
-        print('Please check these values:')
-        for value in sorted(total_diff):
-            print('-', value)
+        return changed
+
+    def merge(self, kind):
+        parts = [watched.orders for watched in self.files.values() if watched.kind == kind]
+        if not parts:
+            return None
+        elif kind == Common_FileKind.JIVO:
+            return tuple([functools.reduce(Common_OrderSet.union, sides, Common_OrderSet()) for sides in zip(*parts)])
+        else:
+            return functools.reduce(Common_OrderSet.union, parts, Common_OrderSet())
+
+    def names(self, kind):
+        return [os.path.basename(watched.name) for watched in self.files.values() if watched.kind == kind]
+
+    def is_complete(self):
+        return all([self.indexes.get(kind) is not None for kind in MAIN_BANKING_GROUP_KINDS])
+
+def main_banking_watch_load(name, signature):
+    try:
+        meta = common_recognize_file(name)
+        if not meta:
+            return MainBanking_WatchFile(name, signature)
+        elif meta.kind not in MAIN_BANKING_WATCH_LOADERS:
+            meta.close()
+            return MainBanking_WatchFile(name, signature)
+
+        return MainBanking_WatchFile(name, signature, meta.kind, MAIN_BANKING_WATCH_LOADERS[meta.kind](meta))
+    except Exception as error:
+        print('Not readable yet: %s (%s)' % (os.path.basename(name), error))
+        return MainBanking_WatchFile(name, None)
+
+def main_banking_watch(argv):
+    (options, argv) = main_banking_watch_parse_options(argv)
+    directory = argv[0]
+    if not os.path.isdir(directory):
+        print('Not readable:', directory)
+        print()
+        return
+
+    reports = options.reports if options.reports else os.path.join(directory, MAIN_BANKING_WATCH_REPORTS)
+    os.makedirs(reports, exist_ok=True)
+
+    watch = MainBanking_Watch(directory)
+    print('Watching %s, reports go to %s' % (directory, reports))
+    print()
+
+    try:
+        while True:
+            started = time.perf_counter()
+            if watch.scan():
+                if watch.is_complete():
+                    report = main_banking_watch_report(watch, reports)
+                    print('Report: %s (%.2fs)' % (report, time.perf_counter() - started))
+                else:
+                    missing = [MAIN_BANKING_WATCH_TITLES[kind] for kind in MAIN_BANKING_GROUP_KINDS if watch.indexes.get(kind) is None]
+                    print('Waiting for %s' % (', '.join(missing),))
+                print()
+
+            if options.once:
+                break
+            time.sleep(options.interval)
+    except KeyboardInterrupt:
+        print()
+
+def main_banking_watch_report(watch, reports):
+    (alfabank_found_orders, yookassa_found_orders) = watch.indexes[Common_FileKind.JIVO]
+    alfabank_orders = watch.indexes[Common_FileKind.ALFABANK]
+    yookassa_orders = watch.indexes[Common_FileKind.YOOKASSA]
+
+    text = io.StringIO()
+    with contextlib.redirect_stdout(text):
+        print('Generated: %s' % (datetime.now().strftime('%d.%m.%Y %H:%M:%S'),))
+        for kind in MAIN_BANKING_GROUP_KINDS:
+            print('%s: %s' % (MAIN_BANKING_WATCH_TITLES[kind], ', '.join(watch.names(kind))))
         print()
+        diffs = main_banking_compare_orders(alfabank_found_orders, yookassa_found_orders, alfabank_orders, yookassa_orders)
+
+    main_banking_record('banking', None, [watched for watched in watch.files.values() if watched.kind], diffs)
+
+    name = os.path.join(reports, 'banking_%s.txt' % (datetime.now().strftime('%Y%m%d_%H%M%S_%f'),))
+    with common_phase('report', name):
+        with open(name + '.part', 'w', encoding='utf-8') as file:
+            file.write(text.getvalue())
+        os.replace(name + '.part', name)
+
+    return name
+
+MAIN_TRANSACTIONS_SIDES = ('PRIMARY', 'COPY')
+
+def main_transactions(argv):
+    if common_options.external:
+        total_diff = common_external_diff(
+            common_stream_column(argv[0], 2, common_is_blank_or_hidden),
+            common_stream_column(argv[1], 2, common_is_blank_or_hidden),
+            sides=True,
+        )
     else:
-        print('No difference found')
+        (first_orders, second_orders) = common_load_all([
+            (main_transactions_find_orders, argv[0]),
+            (main_transactions_find_orders, argv[1]),
+        ])
+
+        with common_phase('compare') as phase:
+            first_diff = first_orders.difference(second_orders)
+            second_diff = second_orders.difference(first_orders)
+            total_diff = sorted([(id, 0) for id in first_diff] + [(id, 1) for id in second_diff])
+            phase.add(len(first_orders) + len(second_orders))
+
+    inputs = [(side.lower(), name) for (side, name) in zip(MAIN_TRANSACTIONS_SIDES, argv)]
+    with common_history('transactions', common_history_scope(argv[:2]), inputs) as history:
+        entries = history.track('Transactions', MAIN_TRANSACTIONS_SIDES, total_diff)
+        with common_phase('report'):
+            common_print_entries('Please check these orders:', (id.lstrip('0') for id in entries), 'No issues found')
+
+@common_cached('transactions', 1)
+def main_transactions_find_orders(name):
+    return set(common_stream_column(name, 2, common_is_blank_or_hidden))
+
+MAIN_SIMPLE_DEFAULT_SPECS = ('A:B',)
+
+class MainSimple_Column:
+    def __init__(self, sheet, index):
+        self.sheet = sheet
+        self.index = index
+
+    def key(self):
+        return (self.sheet if self.sheet else '', self.index)
+
+    def label(self):
+        letter = common_column_letter(self.index)
+        return '%s!%s' % (self.sheet, letter) if self.sheet else letter
+
+def main_simple(argv):
+    name = argv[0]
+    try:
+        comparisons = main_simple_parse_specs(argv[1:] if argv[1:] else MAIN_SIMPLE_DEFAULT_SPECS)
+    except ValueError as error:
+        print(error)
         print()
+        return
 
-def main_simple_find_values(name, column):
-    workbook = xlrd.open_workbook(name)
-    worksheet = workbook.sheet_by_index(0)
+    single = len(comparisons) == 1
 
-    values = set()
+    if common_options.external:
+        diffs = [(first, second, common_external_diff(
+            common_stream_column(name, first.index, common_is_blank, first.sheet),
+            common_stream_column(name, second.index, common_is_blank, second.sheet),
+        )) for (first, second) in comparisons]
+    else:
+        columns = dict()
+        for comparison in comparisons:
+            for column in comparison:
+                columns[column.key()] = column
+
+        (values,) = common_load_all([
+            (main_simple_find_values, name, tuple(sorted(columns.keys()))),
+        ])
+
+        with common_phase('compare') as phase:
+            diffs = list()
+            for (first, second) in comparisons:
+                total_diff = values[first.key()].symmetric_difference(values[second.key()])
+                diffs.append((first, second, sorted(total_diff)))
+                phase.add(len(values[first.key()]) + len(values[second.key()]))
+
+    with common_phase('report'):
+        main_simple_print_diffs(diffs, single)
+
+def main_simple_print_diffs(diffs, single):
+    for (first, second, total_diff) in diffs:
+        if single:
+            common_print_entries('Please check these values:', total_diff, 'No difference found')
+        else:
+            pair = '%s & %s' % (first.label(), second.label())
+            common_print_entries('%s, please check these values:' % (pair,), total_diff, '%s, no difference found' % (pair,))
+
+def main_simple_parse_specs(specs):
+    comparisons = list()
+    for spec in specs:
+        columns = list()
+        sheet = None
+        for token in spec.split(':'):
+            column = main_simple_parse_column(token, sheet)
+            sheet = column.sheet
+            columns.append(column)
+        if len(columns) < 2:
+            raise ValueError('Comparison needs at least two columns: %s' % (spec,))
+
+        for (ic, first) in enumerate(columns):
+            for second in columns[ic + 1:]:
+                comparisons.append((first, second))
+
+    return comparisons
+
+def main_simple_parse_column(token, sheet=None):
+    (prefix, separator, letters) = token.rpartition('!')
+    letters = letters.strip().upper()
+    if not letters.isalpha() or not letters.isascii():
+        raise ValueError('Not a column: %s' % (token,))
+
+    return MainSimple_Column(prefix if separator else sheet, common_xlsx_column_index(letters))
+
+@common_cached('simple', 2)
+def main_simple_find_values(name, keys):
+    sheets = dict()
+    for (sheet_name, index) in keys:
+        sheets.setdefault(sheet_name, list()).append(index)
+
+    values = dict()
+    sheet = None
+    try:
+        for (sheet_name, indices) in sheets.items():
+            if sheet is None:
+                sheet = common_open_sheet(name, sheet_name if sheet_name else None)
+            else:
+                sheet.select(sheet_name if sheet_name else None)
 
-    for i in range(1, worksheet.nrows):
-        value = worksheet.cell_value(i, column)
-        if not value:
-            continue
+            for (index, column_values) in zip(indices, sheet.columns(indices, 1)):
+                values[(sheet_name, index)] = set([value for value in column_values if not common_is_blank(value)])
+    finally:
+        if sheet is not None:
+            sheet.close()
 
-        values.add(value)
-    
     return values
 
+MAIN_SIXTYTWO_HEADER_ROWS = 9
+MAIN_SIXTYTWO_FIRST_AMOUNT = 3
+MAIN_SIXTYTWO_SIDES = ('FIRST', 'SECOND')
+
+class MainSixtytwo_Ledger:
+    def __init__(self, labels):
+        self.labels = labels
+        self.customers = dict()
+        self.amounts = array('d')
+        self.texts = dict()
+
+    def add(self, id, name, row):
+        digest = hashlib.blake2b(digest_size=16)
+        offset = len(self.amounts)
+
+        for (ic, value) in enumerate(row):
+            (amount, text) = main_sixtytwo_parse_amount(value)
+            self.amounts.append(amount)
+            if text is not None:
+                self.texts[offset + ic] = text
+            digest.update(('%.2f;' % amount if text is None else '%s;' % text).encode())
+
+        self.customers[id] = (name, digest.digest(), offset, len(row))
+
+    def __len__(self):
+        return len(self.customers)
+
+    def values(self, id):
+        (name, digest, offset, length) = self.customers[id]
+        return [self.texts.get(index, self.amounts[index]) for index in range(offset, offset + length)]
+
+    def label(self, ic):
+        column = MAIN_SIXTYTWO_FIRST_AMOUNT + ic
+        letter = common_column_letter(column)
+        if column < len(self.labels) and self.labels[column]:
+            return '%s (%s)' % (letter, self.labels[column])
+        else:
+            return letter
+
 def main_sixtytwo(argv):
-    first_customers = main_sixtytwo_find_customers(argv[0])
-    second_customers = main_sixtytwo_find_customers(argv[1])
+    (first_ledger, second_ledger) = common_load_all([
+        (main_sixtytwo_find_customers, argv[0]),
+        (main_sixtytwo_find_customers, argv[1]),
+    ])
+
+    inputs = [(side.lower(), name) for (side, name) in zip(MAIN_SIXTYTWO_SIDES, argv)]
+    with common_history('sixtytwo', common_history_scope(argv[:2]), inputs) as history:
+        with common_phase('compare') as phase:
+            main_sixtytwo_compare(argv, first_ledger, second_ledger, history)
+            phase.add(len(first_ledger) + len(second_ledger))
+
+def main_sixtytwo_compare(argv, first_ledger, second_ledger, history):
+    first_customers = first_ledger.customers
+    second_customers = second_ledger.customers
+
+    first_exclusive = list()
+    second_exclusive = list()
 
     ids = set(first_customers.keys()).union(second_customers.keys())
     for id in ids:
-        (first_name, first_info) = first_customers.get(id, (None, None))
-        (second_name, second_info) = second_customers.get(id, (None, None))
+        (first_name, first_digest, *first_place) = first_customers.get(id, (None, None))
+        (second_name, second_digest, *second_place) = second_customers.get(id, (None, None))
 
-        if first_info == second_info:
+        if first_digest == second_digest:
             continue
-        elif not first_info:
-            print('Exclusive in %s: "%s"' % (os.path.basename(argv[1]), second_name))
-        elif not second_info:
-            print('Exclusive in %s: "%s"' % (os.path.basename(argv[0]), first_name))
+        elif not first_digest:
+            second_exclusive.append((id, second_name))
+        elif not second_digest:
+            first_exclusive.append((id, first_name))
         elif first_name != second_name:
             print('Differ by names: "%s" & "%s"' % (first_name, second_name))
+            history.add_difference('names', (id, first_name), (id, second_name))
         else:
             print('Differ by amounts: "%s"' % (first_name,))
+            main_sixtytwo_print_columns(first_ledger, second_ledger, id, id, history, 'amounts')
+
+    (pairs, first_exclusive, second_exclusive) = main_sixtytwo_match_names(first_exclusive, second_exclusive)
+    for (score, (first_id, first_name), (second_id, second_name)) in pairs:
+        if first_customers[first_id][1] == second_customers[second_id][1]:
+            print('Likely the same (%.2f): "%s" & "%s"' % (score, first_name, second_name))
+            history.add_difference('likely', (first_id, first_name), (second_id, second_name))
+        else:
+            print('Likely the same (%.2f), differ by amounts: "%s" & "%s"' % (score, first_name, second_name))
+            main_sixtytwo_print_columns(first_ledger, second_ledger, first_id, second_id, history, 'likely-amounts')
+
+    for (id, name) in second_exclusive:
+        print('Exclusive in %s: "%s"' % (os.path.basename(argv[1]), name))
+    for (id, name) in first_exclusive:
+        print('Exclusive in %s: "%s"' % (os.path.basename(argv[0]), name))
+
+    history.add_items('62', MAIN_SIXTYTWO_SIDES[0], [id for (id, name) in first_exclusive])
+    history.add_items('62', MAIN_SIXTYTWO_SIDES[1], [id for (id, name) in second_exclusive])
+
+def main_sixtytwo_print_columns(first_ledger, second_ledger, first_id, second_id, history, kind):
+    first = (first_id, first_ledger.customers[first_id][0])
+    second = (second_id, second_ledger.customers[second_id][0])
+
+    first_values = first_ledger.values(first_id)
+    second_values = second_ledger.values(second_id)
+
+    for ic in range(0, max(len(first_values), len(second_values))):
+        first_value = first_values[ic] if ic < len(first_values) else math.nan
+        second_value = second_values[ic] if ic < len(second_values) else math.nan
+        if main_sixtytwo_format_amount(first_value) != main_sixtytwo_format_amount(second_value):
+            print('- %s: %s & %s' % (first_ledger.label(ic), main_sixtytwo_format_amount(first_value), main_sixtytwo_format_amount(second_value)))
+            history.add_difference(kind, first, second, first_ledger.label(ic), main_sixtytwo_format_amount(first_value), main_sixtytwo_format_amount(second_value))
+
+MAIN_SIXTYTWO_LEGAL_FORMS = ('ооо', 'оао', 'зао', 'пао', 'ао', 'ип', 'нао', 'ано', 'нко', 'тоо', 'чоп', 'гуп', 'муп', 'фгуп', 'llc', 'ltd', 'inc', 'gmbh')
+MAIN_SIXTYTWO_NAME_JUNK = re.compile(r'[^0-9a-zа-я]+')
+MAIN_SIXTYTWO_MATCH_THRESHOLD = 0.6
+MAIN_SIXTYTWO_MATCH_CANDIDATES = 10
+MAIN_SIXTYTWO_COMMON_TRIGRAM_SHARE = 0.05
+MAIN_SIXTYTWO_COMMON_TRIGRAM_MIN = 20
+
+def main_sixtytwo_normalize_name(name):
+    words = MAIN_SIXTYTWO_NAME_JUNK.sub(' ', str(name).lower().replace('ё', 'е')).split()
+    return ' '.join([word for word in words if word not in MAIN_SIXTYTWO_LEGAL_FORMS])
+
+def main_sixtytwo_trigrams(name):
+    padded = ' %s ' % (name,)
+    return frozenset([padded[ic:ic + 3] for ic in range(0, len(padded) - 2)])
+
+class MainSixtytwo_NameIndex:
+    def __init__(self, names):
+        self.trigrams = [main_sixtytwo_trigrams(main_sixtytwo_normalize_name(name)) for name in names]
+        self.postings = dict()
+        for (index, trigrams) in enumerate(self.trigrams):
+            for trigram in trigrams:
+                self.postings.setdefault(trigram, list()).append(index)
+
+        limit = max(MAIN_SIXTYTWO_COMMON_TRIGRAM_MIN, len(names) * MAIN_SIXTYTWO_COMMON_TRIGRAM_SHARE)
+        for trigram in [trigram for (trigram, indices) in self.postings.items() if len(indices) > limit]:
+            del self.postings[trigram]
+
+    def search(self, name):
+        trigrams = main_sixtytwo_trigrams(main_sixtytwo_normalize_name(name))
+        shared = dict()
+        for trigram in trigrams:
+            for index in self.postings.get(trigram, ()):
+                shared[index] = shared.get(index, 0) + 1
+
+        best = heapq.nlargest(MAIN_SIXTYTWO_MATCH_CANDIDATES, shared.items(), key=lambda item: item[1] / len(self.trigrams[item[0]]))
+        return [(main_sixtytwo_similarity(trigrams, self.trigrams[index]), index) for (index, count) in best]
+
+def main_sixtytwo_similarity(first, second):
+    if not first or not second:
+        return 0.0
+    else:
+        return 2 * len(first & second) / (len(first) + len(second))
+
+def main_sixtytwo_has_inn(item):
+    (id, name) = item
+    return id != name
+
+def main_sixtytwo_match_names(first_items, second_items):
+    if not first_items or not second_items:
+        return (list(), first_items, second_items)
+
+    # two different INNs are two different legal entities, so a pair needs a side keyed by name
+    named = [second_index for (second_index, item) in enumerate(second_items) if not main_sixtytwo_has_inn(item)]
+    index = MainSixtytwo_NameIndex([name for (id, name) in second_items])
+    named_index = MainSixtytwo_NameIndex([second_items[second_index][1] for second_index in named]) if named else None
+
+    candidates = list()
+    for (first_index, item) in enumerate(first_items):
+        if not main_sixtytwo_has_inn(item):
+            found = index.search(item[1])
+        elif named_index:
+            found = [(score, named[position]) for (score, position) in named_index.search(item[1])]
+        else:
+            continue
+
+        for (score, second_index) in found:
+            if score >= MAIN_SIXTYTWO_MATCH_THRESHOLD:
+                candidates.append((score, first_index, second_index))
+
+    pairs = list()
+    (first_used, second_used) = (set(), set())
+    for (score, first_index, second_index) in sorted(candidates, key=lambda candidate: -candidate[0]):
+        if first_index in first_used or second_index in second_used:
+            continue
+
+        first_used.add(first_index)
+        second_used.add(second_index)
+        pairs.append((score, first_items[first_index], second_items[second_index]))
+
+    first_rest = [item for (ic, item) in enumerate(first_items) if ic not in first_used]
+    second_rest = [item for (ic, item) in enumerate(second_items) if ic not in second_used]
+    return (pairs, first_rest, second_rest)
+
+def main_sixtytwo_parse_amount(value):
+    if isinstance(value, float) or isinstance(value, int):
+        return (float(value), None)
+    elif not value:
+        return (math.nan, None)
+
+    try:
+        return (float(value.replace(' ', '').replace(',', '.')), None)
+    except ValueError:
+        return (math.nan, value)
+
+def main_sixtytwo_format_amount(value):
+    if isinstance(value, str):
+        return value
+    elif math.isnan(value):
+        return '-'
+    else:
+        return '%.2f' % value
+
+def main_sixtytwo_read_labels(rows):
+    labels = list()
+    for row in rows:
+        carried = ''
+        for ic in range(0, len(row)):
+            if ic >= len(labels):
+                labels.append(list())
+            if ic < MAIN_SIXTYTWO_FIRST_AMOUNT:
+                continue
+
+            value = str(row[ic]).strip()
+            carried = value if value else carried
+            if carried and carried not in labels[ic]:
+                labels[ic].append(carried)
+
+    return [' / '.join(parts) for parts in labels]
 
+@common_cached('sixtytwo', 2)
 def main_sixtytwo_find_customers(name):
-    workbook = xlrd.open_workbook(name)
-    worksheet = workbook.sheet_by_index(0)
+    sheet = common_open_sheet(name)
+
+    header = list()
+    ledger = None
+    previous_row = None
+
+    for row in sheet.iter_rows():
+        if len(header) < MAIN_SIXTYTWO_HEADER_ROWS:
+            header.append(row)
+            continue
+        elif ledger is None:
+            ledger = MainSixtytwo_Ledger(main_sixtytwo_read_labels(header))
 
-    customers = dict()
+        if previous_row is None:
+            previous_row = row
+            continue
+
+        (row, previous_row) = (previous_row, row)
+        row = common_project_row(row, range(0, max(len(row), MAIN_SIXTYTWO_FIRST_AMOUNT)))
 
-    for ir in range(9, worksheet.nrows - 1):
-        name = worksheet.cell_value(ir, 0)
-        inn = worksheet.cell_value(ir, 2)
+        name = row[0]
+        inn = row[2]
         id = inn if inn else name
         # print(id)
 
-        info = str()
-        for ic in range(3, worksheet.row_len(ir)):
-            info += str(worksheet.cell_value(ir, ic)) + ";"
-        # print(info)
+        ledger.add(id, name, row[MAIN_SIXTYTWO_FIRST_AMOUNT:])
+
+    sheet.close()
+    return ledger if ledger else MainSixtytwo_Ledger(main_sixtytwo_read_labels(header))
+
+MAIN_HISTORY_QUERIES = ('open', 'period', 'runs', 'differences')
+
+class MainHistory_Options:
+    def __init__(self):
+        self.procedure = None
+        self.source = None
+        self.min_age = 0
+        self.since = None
+        self.till = None
+
+def main_history_parse_options(argv):
+    options = MainHistory_Options()
+
+    while argv:
+        if len(argv) < 2:
+            raise ValueError('Missing value: %s' % (argv[0],))
+
+        match argv[0]:
+            case '--procedure':
+                options.procedure = argv[1]
+            case '--source':
+                options.source = argv[1]
+            case '--min-age':
+                options.min_age = int(argv[1])
+            case '--since':
+                options.since = main_history_parse_day(argv[1])
+            case '--till':
+                options.till = main_history_parse_day(argv[1]) + timedelta(days=1)
+            case _:
+                raise ValueError('Unknown option: %s' % (argv[0],))
+
+        argv = argv[2:]
+
+    return options
+
+def main_history_parse_day(value):
+    day = common_parse_day_text(value)
+    if day is None:
+        raise ValueError('Not a date: %s' % (value,))
+
+    return date.fromordinal(day)
+
+def main_history(argv):
+    query = argv[0] if argv else MAIN_HISTORY_QUERIES[0]
+    try:
+        if query not in MAIN_HISTORY_QUERIES:
+            raise ValueError('Unknown history query: %s' % (query,))
+        options = main_history_parse_options(argv[1:])
+    except ValueError as error:
+        print(error)
+        print()
+        return
 
-        customers[id] = (name, info)
-    
-    return customers
+    if not os.path.exists(common_history_path()):
+        print('No history recorded yet')
+        print()
+        return
+
+    connection = common_history_connect()
+    try:
+        match query:
+            case 'open':
+                main_history_open(connection, options)
+            case 'period':
+                main_history_period(connection, options)
+            case 'runs':
+                main_history_runs(connection, options)
+            case 'differences':
+                main_history_differences(connection, options)
+    finally:
+        connection.close()
+
+def main_history_filters(options, started, source=None):
+    (clauses, params) = (list(), list())
+
+    if options.procedure:
+        clauses.append('procedure = ?')
+        params.append(options.procedure)
+    if options.source and source:
+        clauses.append('%s = ? COLLATE NOCASE' % (source,))
+        params.append(options.source)
+    if options.since:
+        clauses.append('%s >= ?' % (started,))
+        params.append(options.since.isoformat())
+    if options.till:
+        clauses.append('%s < ?' % (started,))
+        params.append(options.till.isoformat())
+
+    return (' AND '.join(clauses) if clauses else '1', params)
+
+def main_history_format_time(value):
+    return datetime.fromisoformat(value).strftime('%d.%m.%Y %H:%M')
+
+def main_history_group_title(procedure, scope, source, direction):
+    title = '%s/%s in %s' % (source, direction, procedure)
+    return '%s, %s' % (title, scope) if scope else title
+
+def main_history_open(connection, options):
+    (where, params) = main_history_filters(options, 'since', 'source')
+    now = datetime.now()
+    if options.min_age:
+        where += ' AND since <= ?'
+        params.append((now - timedelta(days=options.min_age)).isoformat(sep=' ', timespec='seconds'))
+
+    rows = connection.execute(
+        'SELECT procedure, scope, source, direction, item, since FROM open_items WHERE %s '
+        'ORDER BY procedure, scope, source, direction, since, item' % (where,),
+        params,
+    )
+
+    found = False
+    for ((procedure, scope, source, direction), items) in groupby(rows, key=operator.itemgetter(0, 1, 2, 3)):
+        found = True
+        print('Open items, %s:' % (main_history_group_title(procedure, scope, source, direction),))
+        for (*group, item, since) in items:
+            print('- %s, open since %s (%d days)' % (item, main_history_format_time(since), (now - datetime.fromisoformat(since)).days))
+        print()
+
+    if not found:
+        print('No open items found')
+        print()
+
+def main_history_period(connection, options):
+    (where, params) = main_history_filters(options, 'runs.started', 'items.source')
+    rows = connection.execute(
+        'SELECT procedure, scope, source, direction, item, count(*), min(started), max(started) '
+        'FROM runs JOIN items ON items.run_id = runs.id WHERE %s '
+        'GROUP BY procedure, scope, source, direction, item '
+        'ORDER BY procedure, scope, source, direction, item' % (where,),
+        params,
+    )
+
+    found = False
+    for ((procedure, scope, source, direction), items) in groupby(rows, key=operator.itemgetter(0, 1, 2, 3)):
+        found = True
+        print('Unmatched items, %s:' % (main_history_group_title(procedure, scope, source, direction),))
+        for (*group, item, runs, first, last) in items:
+            print('- %s, in %d runs from %s till %s' % (item, runs, main_history_format_time(first), main_history_format_time(last)))
+        print()
+
+    if not found:
+        print('No unmatched items found')
+        print()
+
+def main_history_runs(connection, options):
+    (where, params) = main_history_filters(options, 'started')
+    runs = connection.execute(
+        'SELECT id, started, procedure, scope, '
+        '(SELECT count(*) FROM items WHERE items.run_id = runs.id), '
+        '(SELECT count(*) FROM differences WHERE differences.run_id = runs.id) '
+        'FROM runs WHERE %s ORDER BY started, id' % (where,),
+        params,
+    ).fetchall()
+
+    if not runs:
+        print('No runs found')
+        print()
+        return
+
+    for (id, started, procedure, scope, items, differences) in runs:
+        print('Run %d, %s, %s%s: %d unmatched, %d differences' % (id, main_history_format_time(started), procedure, ', %s' % (scope,) if scope else '', items, differences))
+        for (kind, name, hash) in connection.execute('SELECT kind, name, hash FROM inputs WHERE run_id = ? ORDER BY rowid', (id,)):
+            print('- %s: %s (%s)' % (kind, name, hash[:12]))
+    print()
+
+def main_history_differences(connection, options):
+    (where, params) = main_history_filters(options, 'runs.started')
+    rows = connection.execute(
+        'SELECT runs.id, runs.started, kind, first_customer, first_name, second_name, label, first_value, second_value '
+        'FROM runs JOIN differences ON differences.run_id = runs.id WHERE %s '
+        'ORDER BY runs.started, runs.id, differences.rowid' % (where,),
+        params,
+    )
+
+    found = False
+    for ((id, started), differences) in groupby(rows, key=operator.itemgetter(0, 1)):
+        found = True
+        print('Run %d, %s:' % (id, main_history_format_time(started)))
+        for (id, started, kind, customer, first_name, second_name, label, first_value, second_value) in differences:
+            if label:
+                print('- %s "%s" & "%s", %s: %s & %s' % (kind, first_name, second_name, label, first_value, second_value))
+            else:
+                print('- %s "%s" & "%s"' % (kind, first_name, second_name))
+        print()
+
+    if not found:
+        print('No differences found')
+        print()
 
 class MainBanking_Dzo:
     def __init__(self, activated, money, since, till):
@@ -384,183 +2792,761 @@ class MainBanking_Dzo:
     def __repr__(self):
         return "'%d: %s:%s @%s'" % (self.money, self.since, self.till, self.activated)
 
+class MainDzo_Transactions:
+    __slots__ = ('ids', 'activated', 'money', 'since', 'till', 'errors')
+
+    def __init__(self):
+        self.ids = array('q')
+        self.activated = array('l')
+        self.money = array('d')
+        self.since = array('l')
+        self.till = array('l')
+        self.errors = list()
+
+    def append(self, id, activated, money, since, till):
+        self.ids.append(id)
+        self.activated.append(activated)
+        self.money.append(money)
+        self.since.append(since)
+        self.till.append(till)
+
+    def finish(self):
+        ids = self.ids
+        if all(map(operator.lt, ids, ids[1:])):
+            return
+
+        order = sorted(range(0, len(ids)), key=ids.__getitem__)
+        kept = list()
+        for (ir, following) in zip(order, order[1:] + [None]):
+            if following is not None and ids[following] == ids[ir]:
+                self.errors.append((str(ids[ir]), 'duplicate id, the later row is used'))
+            else:
+                kept.append(ir)
+
+        for slot in ('ids', 'activated', 'money', 'since', 'till'):
+            values = getattr(self, slot)
+            setattr(self, slot, array(values.typecode, [values[ir] for ir in kept]))
+
+    def find(self, id):
+        index = bisect_left(self.ids, id)
+        return index if index < len(self.ids) and self.ids[index] == id else None
+
+    def meta(self, index):
+        return MainBanking_Dzo(date.fromordinal(self.activated[index]), self.money[index], date.fromordinal(self.since[index]), date.fromordinal(self.till[index]))
+
+    def period(self):
+        if not self.ids:
+            return (date.max, date.min)
+
+        return (date.fromordinal(min(self.since)), date.fromordinal(max(self.till)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, id):
+        return self.find(id) is not None
+
+    def __getitem__(self, id):
+        index = self.find(id)
+        if index is None:
+            raise KeyError(id)
+
+        return self.meta(index)
+
+    def get(self, id, default=None):
+        index = self.find(id)
+        return default if index is None else self.meta(index)
+
+    def keys(self):
+        return list(self.ids)
+
+    def values(self):
+        return [self.meta(index) for index in range(0, len(self.ids))]
+
+    def items(self):
+        return [(id, self.meta(index)) for (index, id) in enumerate(self.ids)]
+
+MAIN_DZO_SHEET = 'сбербизнессофт'
+MAIN_DZO_FIRST_DATE_COLUMN = 7
+MAIN_DZO_SOURCE_COLUMNS = (0, 1, 3, 4, 5)
+MAIN_DZO_SOURCE_KIND = 2
+MAIN_DZO_ERRORS_SHOWN = 20
+MAIN_DZO_BLANK_DATE = date(1899, 12, 30)
+MAIN_DZO_MATRIX_INDIRECT = 'indirect'
+MAIN_DZO_MATRIX_DIRECT = 'direct'
+MAIN_DZO_MATRIX_VALUES = 'values'
+MAIN_DZO_INDIRECT_CELLS = {
+    'cell_money': 'INDIRECT(ADDRESS(ROW(); 3; 3))',
+    'cell_since': 'INDIRECT(ADDRESS(ROW(); 4; 3))',
+    'cell_till': 'INDIRECT(ADDRESS(ROW(); 5; 3))',
+    'cell_month': 'INDIRECT(ADDRESS(1; COLUMN(); 2))',
+}
+MAIN_DZO_DIRECT_CELLS = {
+    'cell_money': '$C{row}',
+    'cell_since': '$D{row}',
+    'cell_till': '$E{row}',
+    'cell_month': '{column}$1',
+}
+
+class MainDzo_Options:
+    def __init__(self):
+        self.headless = False
+        self.confirmed = False
+        self.matrix_mode = MAIN_DZO_MATRIX_INDIRECT
+        self.verify = False
+        self.incremental = False
+
+def main_dzo_parse_options(argv):
+    options = MainDzo_Options()
+
+    while argv:
+        match argv[0]:
+            case '--headless':
+                options.headless = True
+            case '--yes':
+                options.confirmed = True
+            case '--direct':
+                options.matrix_mode = MAIN_DZO_MATRIX_DIRECT
+            case '--values':
+                options.matrix_mode = MAIN_DZO_MATRIX_VALUES
+            case '--verify':
+                options.verify = True
+            case '--incremental':
+                options.incremental = True
+            case _:
+                break
+
+        argv = argv[1:]
+
+    return (options, argv)
+
 def main_dzo(argv):
+    (options, argv) = main_dzo_parse_options(argv)
     lang = argv[0]
 
     transactions = main_dzo_read_source(argv[2])
-    # print(transactions)
+    main_dzo_print_source_errors(transactions)
 
-    workbook = xlwings.Book(argv[1])
-    for sheet in workbook.sheets:
-        if sheet.name != 'сбербизнессофт':
-            continue
-        else:
-            worksheet = sheet
-    
-    if not worksheet:
+    with common_phase('open', argv[1]):
+        sheet = main_dzo_open_sheet(argv[1], options.headless)
+    if not sheet:
         print('Worksheet not found')
         return
 
-    (previous_cell, initial_cell) = main_dzo_find_initial_cell(worksheet)
-    match input('Going to place the data starting the line #%d: (y)es or (n)o? ' % (initial_cell.row,)):
-        case 'y' | 'yes' | 'д' | 'да' | '1':
-            print()
-            (group_since, group_till) = main_dzo_migrate_from_source(worksheet, initial_cell, transactions)
-            date_anchor = main_dzo_ensure_date_headers(worksheet, group_since, group_till)
-            main_dzo_fill_matrix(lang, worksheet, previous_cell, initial_cell, transactions, date_anchor)
-        case _:
+    lang = sheet.formula_lang(lang)
+
+    if options.verify:
+        (group_since, group_till) = main_dzo_find_period(transactions)
+        date_anchor = main_dzo_plan_date_headers(sheet, group_since, group_till)
+        if date_anchor:
+            with common_phase('compare') as phase:
+                main_dzo_verify(transactions, date_anchor)
+                phase.add(len(transactions))
+        return
+
+    changed = dict()
+    if options.incremental:
+        with common_phase('compare') as phase:
+            phase.add(len(transactions))
+            (transactions, changed) = main_dzo_find_delta(transactions, main_dzo_read_existing(sheet))
+        print('New transactions: %d, changed transactions: %d' % (len(transactions), len(changed)))
+        print()
+
+        if not transactions and not changed:
             return
 
+    (previous_row, initial_row) = main_dzo_find_initial_row(sheet, options.incremental)
+
+    if not options.confirmed:
+        if transactions:
+            question = 'Going to place the data starting the line #%d: (y)es or (n)o? ' % (initial_row,)
+        else:
+            question = 'Going to update %d existing lines: (y)es or (n)o? ' % (len(changed),)
+
+        match input(question):
+            case 'y' | 'yes' | 'д' | 'да' | '1':
+                pass
+            case _:
+                return
+
+    print()
+    if transactions:
+        with common_phase('write', 'source lines') as phase:
+            main_dzo_migrate_from_source(sheet, initial_row, transactions)
+            phase.add(len(transactions))
+
+    (group_since, group_till) = main_dzo_find_period(transactions)
+    if changed:
+        (changed_since, changed_till) = main_dzo_find_period(dict([(id, meta) for (id, (row, meta)) in changed.items()]))
+        (group_since, group_till) = (min(group_since, changed_since), max(group_till, changed_till))
+    with common_phase('write', 'date headers'):
+        date_anchor = main_dzo_ensure_date_headers(sheet, group_since, group_till)
+    if not date_anchor:
+        return
+
+    if changed:
+        with common_phase('write', 'changed lines') as phase:
+            main_dzo_update_rows(lang, sheet, changed, date_anchor, options.matrix_mode)
+            phase.add(len(changed))
+    if transactions:
+        with common_phase('write', 'matrix') as phase:
+            main_dzo_fill_matrix(lang, sheet, previous_row, initial_row, transactions, date_anchor, options.matrix_mode)
+            phase.add(len(transactions))
+
+    with common_phase('write', 'save'):
+        sheet.save()
+
+class MainDzo_Sheet:
+    def formula_lang(self, lang):
+        return lang
+
+    def date_value(self, value):
+        return value.strftime('%d.%m.%Y')
+
+    def value(self, row, column):
+        return self.read_block(row, column, 1, 1)[0][0]
+
+    def read_block(self, row, column, rows, columns):
+        raise NotImplementedError()
+
+    def write_block(self, row, column, values):
+        raise NotImplementedError()
+
+    def copy_row(self, source_row, target_row):
+        raise NotImplementedError()
+
+    def last_row(self):
+        raise NotImplementedError()
+
+    def last_column(self):
+        raise NotImplementedError()
+
+    def save(self):
+        pass
+
+class MainDzo_XlwingsSheet(MainDzo_Sheet):
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def read_block(self, row, column, rows, columns):
+        values = self.worksheet.range((row, column), (row + rows - 1, column + columns - 1)).options(ndim=2).value
+        return values
+
+    def write_block(self, row, column, values):
+        if values:
+            self.worksheet.range((row, column)).value = values
+
+    def copy_row(self, source_row, target_row):
+        self.worksheet.range('%d:%d' % (source_row, source_row)).copy(self.worksheet.range('%d:%d' % (target_row, target_row)))
+
+    def last_row(self):
+        return self.worksheet.used_range.last_cell.row
+
+    def last_column(self):
+        return self.worksheet.used_range.last_cell.column
+
+class MainDzo_OpenpyxlSheet(MainDzo_Sheet):
+    def __init__(self, name, workbook, worksheet):
+        self.name = name
+        self.workbook = workbook
+        self.worksheet = worksheet
+
+    def formula_lang(self, lang):
+        return 'en'
+
+    def date_value(self, value):
+        return value
+
+    def read_block(self, row, column, rows, columns):
+        values = list()
+        for cells in self.worksheet.iter_rows(min_row=row, max_row=row + rows - 1, min_col=column, max_col=column + columns - 1, values_only=True):
+            values.append(list(cells))
+
+        return values
+
+    def write_block(self, row, column, values):
+        for (ir, line) in enumerate(values):
+            for (ic, value) in enumerate(line):
+                if isinstance(value, str) and value.startswith('='):
+                    value = '=' + value[1:].strip().replace(';', ',')
+                self.worksheet.cell(row + ir, column + ic).value = value
+
+    def copy_row(self, source_row, target_row):
+        from openpyxl.formula.translate import Translator
+
+        for source in self.worksheet[source_row]:
+            target = self.worksheet.cell(target_row, source.column)
+            if isinstance(source.value, str) and source.value.startswith('='):
+                target.value = Translator(source.value, origin=source.coordinate).translate_formula(target.coordinate)
+            else:
+                target.value = source.value
+            if source.has_style:
+                target._style = copy.copy(source._style)
+
+    def last_row(self):
+        return self.worksheet.max_row
+
+    def last_column(self):
+        return self.worksheet.max_column
+
+    def save(self):
+        self.workbook.save(self.name)
+
+def main_dzo_open_sheet(name, headless):
+    if headless:
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(name)
+        if MAIN_DZO_SHEET in workbook.sheetnames:
+            return MainDzo_OpenpyxlSheet(name, workbook, workbook[MAIN_DZO_SHEET])
+    else:
+        import xlwings
+
+        workbook = xlwings.Book(name)
+        for worksheet in workbook.sheets:
+            if worksheet.name == MAIN_DZO_SHEET:
+                return MainDzo_XlwingsSheet(worksheet)
+
+    return None
+
+@common_cached('dzo', 3)
 def main_dzo_read_source(name):
-    transactions = dict()
+    transactions = MainDzo_Transactions()
+    days = dict()
 
     meta = common_recognize_file(name)
-    with open(meta.name, encoding=meta.encoding) as file:
-        source = csv.reader(file, delimiter=';')
-        for row in source:
-            if row[2] != 'SBS':
-                continue
-            
-            activated = datetime.strptime(row[1], '%Y-%m-%d').date()
-            since = datetime.strptime(row[4], '%Y-%m-%d').date()
-            till = datetime.strptime(row[5], '%Y-%m-%d').date()
-            transactions[int(row[0])] = MainBanking_Dzo(activated, float(row[3]), since, till)
-
+    short = list()
+    for row in common_scan_csv(meta, MAIN_DZO_SOURCE_COLUMNS, where={MAIN_DZO_SOURCE_KIND: 'SBS'}, short=short):
+        (id, activated, money, since, till) = row
+        try:
+            activated = days.get(activated) or main_dzo_parse_source_day(days, activated)
+            since = days.get(since) or main_dzo_parse_source_day(days, since)
+            till = days.get(till) or main_dzo_parse_source_day(days, till)
+            if till < since:
+                raise ValueError
+            transactions.append(int(id), activated, float(money), since, till)
+        except ValueError:
+            transactions.errors.append((id, main_dzo_validate_source_row(days, row)))
+
+    for row in short:
+        transactions.errors.append((row[0], 'too few columns'))
+
+    transactions.finish()
     return transactions
 
-def main_dzo_find_initial_cell(worksheet):
-    for ir in range(worksheet.used_range.last_cell.row, 0, -1):
-        cell = worksheet.range((ir, 1))
-        if cell.value == 'ИТОГО':
-            return (worksheet.range("%d:%d" % (ir, ir)), cell.offset(3, 0))
-    
-    return (None, worksheet.range((3, 1)))
+def main_dzo_parse_source_day(days, value):
+    try:
+        day = date.fromisoformat(value).toordinal()
+    except ValueError:
+        day = datetime.strptime(value, '%Y-%m-%d').toordinal()
+
+    days[value] = day
+    return day
+
+def main_dzo_validate_source_row(days, row):
+    for (ic, value, kind) in zip(MAIN_DZO_SOURCE_COLUMNS, row, ('an id', 'a date', 'an amount', 'a date', 'a date')):
+        try:
+            match kind:
+                case 'an id':
+                    int(value)
+                case 'an amount':
+                    float(value)
+                case 'a date':
+                    main_dzo_parse_source_day(days, value)
+        except ValueError:
+            return 'column %s: not %s "%s"' % (common_column_letter(ic), kind, value)
+
+    return 'the period ends before it starts'
+
+def main_dzo_print_source_errors(transactions):
+    errors = transactions.errors if isinstance(transactions, MainDzo_Transactions) else ()
+    if not errors:
+        return
+
+    print('Skipped source rows: %d' % (len(errors),))
+    for (id, message) in errors[:MAIN_DZO_ERRORS_SHOWN]:
+        print('- %s: %s' % (id, message))
+    if len(errors) > MAIN_DZO_ERRORS_SHOWN:
+        print('- ... and %d more' % (len(errors) - MAIN_DZO_ERRORS_SHOWN,))
+    print()
+
+def main_dzo_sorted_items(transactions):
+    if isinstance(transactions, MainDzo_Transactions):
+        return transactions.items()
+    else:
+        return sorted(transactions.items())
+
+def main_dzo_find_initial_row(sheet, include_pending=False):
+    last_row = sheet.last_row()
+    values = sheet.read_block(1, 1, last_row, 1)
+    markers = ('ИТОГО', 'ИТОГО ???') if include_pending else ('ИТОГО',)
+
+    for ir in range(last_row, 0, -1):
+        if values[ir - 1][0] in markers:
+            return (ir, ir + 3)
 
-def main_dzo_migrate_from_source(worksheet, initial_cell, transactions):
-    items = sorted(transactions.items())
-    items_num = len(items)
+    return (None, 3)
 
-    group_since = datetime.strptime('9999-01-01 00:00:00', '%Y-%m-%d %H:%M:%S').date()
-    group_till = datetime.strptime('0001-01-01 00:00:00', '%Y-%m-%d %H:%M:%S').date()
+def main_dzo_find_period(transactions):
+    if isinstance(transactions, MainDzo_Transactions):
+        return transactions.period()
 
-    for (index, (id, meta)) in enumerate(items):
+    group_since = date.max
+    group_till = date.min
+
+    for meta in transactions.values():
         group_since = min(group_since, meta.since)
         group_till = max(group_till, meta.till)
 
-        worksheet.range((initial_cell.row + index, 1)).value = meta.activated.strftime('%d.%m.%Y')
-        worksheet.range((initial_cell.row + index, 2)).value = id
-        worksheet.range((initial_cell.row + index, 3)).value = meta.money
-        worksheet.range((initial_cell.row + index, 4)).value = meta.since.strftime('%d.%m.%Y')
-        worksheet.range((initial_cell.row + index, 5)).value = meta.till.strftime('%d.%m.%Y')
-    
     return (group_since, group_till)
 
-def main_dzo_ensure_date_headers(worksheet, since, till):
-    first_date_cell = worksheet.range('G1')
+def main_dzo_source_line(sheet, id, meta):
+    return [
+        sheet.date_value(meta.activated),
+        id,
+        meta.money,
+        sheet.date_value(meta.since),
+        sheet.date_value(meta.till),
+    ]
+
+def main_dzo_migrate_from_source(sheet, initial_row, transactions):
+    block = list()
+    for (id, meta) in main_dzo_sorted_items(transactions):
+        block.append(main_dzo_source_line(sheet, id, meta))
+
+    sheet.write_block(initial_row, 1, block)
+    return main_dzo_find_period(transactions)
+
+def main_dzo_parse_cell_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    elif isinstance(value, date):
+        return value
+    elif isinstance(value, str):
+        try:
+            return datetime.strptime(value.strip(), '%d.%m.%Y').date()
+        except ValueError:
+            return None
+    else:
+        return None
 
-    if not first_date_cell.value:
-        first_date_cell.value = since.strftime('%Y-%m-%d %H:%M:%S')
-    
-    if first_date_cell.value.toordinal() > since.toordinal():
+def main_dzo_read_existing(sheet):
+    existing = dict()
+
+    for (index, line) in enumerate(sheet.read_block(1, 1, sheet.last_row(), 5)):
+        (activated, id, money, since, till) = line
+        if isinstance(id, str) and id.strip().isdigit():
+            id = int(id)
+        elif isinstance(id, float) and id.is_integer():
+            id = int(id)
+        elif not isinstance(id, int) or isinstance(id, bool):
+            continue
+
+        (activated, since, till) = [main_dzo_parse_cell_date(value) for value in (activated, since, till)]
+        if not since or not till or not isinstance(money, (int, float)):
+            continue
+
+        existing[id] = (index + 1, MainBanking_Dzo(activated, float(money), since, till))
+
+    return existing
+
+def main_dzo_find_delta(transactions, existing):
+    fresh = dict()
+    changed = dict()
+
+    for (id, meta) in transactions.items():
+        if id not in existing:
+            fresh[id] = meta
+            continue
+
+        (row, known) = existing[id]
+        if known.since != meta.since or known.till != meta.till or known.activated != meta.activated:
+            changed[id] = (row, meta)
+        elif not math.isclose(known.money, meta.money, abs_tol=0.005):
+            changed[id] = (row, meta)
+
+    return (fresh, changed)
+
+def main_dzo_update_rows(lang, sheet, changed, date_anchor, matrix_mode):
+    (anchor_column, anchor_date, headers) = date_anchor
+
+    transactions = dict([(id, meta) for (id, (row, meta)) in changed.items()])
+    (spans, column_max) = main_dzo_plan_spans(transactions, date_anchor)
+    column_max = max(column_max, sheet.last_column())
+
+    rows = [changed[id][0] for (id, meta, offset, months) in spans]
+    lines = main_dzo_matrix_lines(lang, matrix_mode, spans, rows, date_anchor, column_max)
+
+    for ((id, meta, offset, months), row, line) in zip(spans, rows, lines):
+        print('Updating the line #%d: %s' % (row, id))
+        sheet.write_block(row, 1, [main_dzo_source_line(sheet, id, meta)])
+        sheet.write_block(row, anchor_column, [line])
+
+    print()
+
+def main_dzo_plan_date_headers(sheet, since, till):
+    from dateutil.relativedelta import relativedelta
+
+    first_date = sheet.value(1, MAIN_DZO_FIRST_DATE_COLUMN)
+
+    if not first_date:
+        first_date = datetime.combine(since, datetime.min.time())
+
+    if first_date.toordinal() > since.toordinal():
         print('First cell is too late')
-        return
-    
-    month_diff = common_calc_date_diff(first_date_cell.value, till)
-    for ic in range(first_date_cell.column, first_date_cell.column + month_diff):
-        cell = worksheet.range((1, ic))
-        if not cell.value:
-            date = first_date_cell.value + relativedelta(months = ic)
-            cell.value = date.strftime('%Y-%m-%d %H:%M:%S')
-    
-    return first_date_cell
+        return None
 
-def main_dzo_fill_matrix(lang, worksheet, previous_cell, initial_cell, transactions, date_anchor):
-    row_max = initial_cell.row + len(transactions)
-    column_max = date_anchor.column
+    month_diff = common_calc_date_diff(first_date, till)
+    headers = sheet.read_block(1, MAIN_DZO_FIRST_DATE_COLUMN, 1, month_diff + 1)[0]
+    for ic in range(0, month_diff + 1):
+        if not headers[ic]:
+            headers[ic] = first_date + relativedelta(months = ic)
 
-    def _formula_for_matrix_cell():
-        cell_map = {
-            'cell_money': 'INDIRECT(ADDRESS(ROW(); 3; 3))',
-            'cell_since': 'INDIRECT(ADDRESS(ROW(); 4; 3))',
-            'cell_till': 'INDIRECT(ADDRESS(ROW(); 5; 3))',
-            'cell_month': 'INDIRECT(ADDRESS(1; COLUMN(); 2))',
-        }
-
-        condition_map = {
-            'condition_before': '%(cell_month)s < EOMONTH(%(cell_since)s; -1)' % cell_map,
-            'condition_first': '%(cell_month)s <= %(cell_since)s' % cell_map,
-            'condition_last': '%(cell_till)s <= EOMONTH(%(cell_month)s; 0)' % cell_map,
-            'condition_after': '%(cell_month)s > EOMONTH(%(cell_till)s; 0)' % cell_map,
-        }
-
-        value_map = {
-            'value_money': common_excel_comment(lang, "Сумма счёта:") + '%(cell_money)s' % cell_map,
-            'value_duration': common_excel_comment(lang, "Колво дней в периоде:") + 'DATEDIF(%(cell_since)s; %(cell_till)s; "d") + 1' % cell_map,
-            'value_before': common_excel_comment(lang, "Период ещё не начался:") + '0' % cell_map,
-            'value_first': common_excel_comment(lang, "Первый месяц периода, частичное присутствие:") + 'DAY(EOMONTH(%(cell_month)s; 0)) - DAY(%(cell_since)s) + 1' % cell_map,
-            'value_middle': common_excel_comment(lang, "Промежуточный месяц периода, полное присутствие:") + 'DAY(EOMONTH(%(cell_month)s; 0))' % cell_map,
-            'value_last': common_excel_comment(lang, "Последний месяц периода, частичное присутствие:") + 'DAY(%(cell_till)s)' % cell_map,
-            'value_after': common_excel_comment(lang, "Период уже закончился:") + '0' % cell_map,
-        }
-
-        formula_map = {
-            'formula_month_usage': common_excel_comment(lang, "Колво дней периода в месяце:") + 'IF(%(condition_before)s; %(value_before)s; IF(%(condition_after)s; %(value_after)s; IF(%(condition_first)s; %(value_first)s; IF(%(condition_last)s; %(value_last)s; %(value_middle)s))))' % {**condition_map, **value_map}
-        }
-
-        return common_excel_formula(lang, '= (%(value_money)s) / (%(value_duration)s) * (%(formula_month_usage)s)' % {**value_map, **formula_map})
-
-    def _formula_for_inner_result():
-        cell_map = {
-            'cell_first': 'INDIRECT(ADDRESS(%d; COLUMN(); 2))' % (initial_cell.row),
-            'cell_last': 'INDIRECT(ADDRESS(%d; COLUMN(); 2))' % (initial_cell.row + len(transactions) - 1),
-        }
+    return (MAIN_DZO_FIRST_DATE_COLUMN, first_date, headers)
+
+def main_dzo_ensure_date_headers(sheet, since, till):
+    date_anchor = main_dzo_plan_date_headers(sheet, since, till)
+    if date_anchor:
+        (anchor_column, anchor_date, headers) = date_anchor
+        sheet.write_block(1, anchor_column, [headers])
+
+    return date_anchor
+
+def main_dzo_plan_spans(transactions, date_anchor):
+    (anchor_column, anchor_date, headers) = date_anchor
+
+    spans = list()
+    column_max = anchor_column
+    for (id, meta) in main_dzo_sorted_items(transactions):
+        offset = common_calc_date_diff(anchor_date, meta.since)
+        months = common_calc_date_diff(meta.since, meta.till) + 1
+        spans.append((id, meta, offset, months))
+        column_max = max(column_max, anchor_column + offset + months - 1)
+
+    return (spans, column_max)
+
+def main_dzo_header_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    elif isinstance(value, date):
+        return value
+    else:
+        return MAIN_DZO_BLANK_DATE
+
+def main_dzo_end_of_month(value, months):
+    from dateutil.relativedelta import relativedelta
+
+    return value + relativedelta(months = months, day = 31)
+
+def main_dzo_compute_matrix(spans, headers):
+    from calendar import monthrange
+
+    months = [main_dzo_header_date(header) for header in headers]
+    month_dates = [month.toordinal() for month in months]
+    month_ends = [main_dzo_end_of_month(month, 0).toordinal() for month in months]
+    month_days = [monthrange(month.year, month.month)[1] for month in months]
+
+    matrix = list()
+    for (id, meta, offset, count) in spans:
+        since = meta.since.toordinal()
+        till = meta.till.toordinal()
+        duration = till - since + 1
+        if duration <= 0:
+            matrix.append([None] * count)
+            continue
+
+        rate = meta.money / duration
+        before = main_dzo_end_of_month(meta.since, -1).toordinal()
+        after = main_dzo_end_of_month(meta.till, 0).toordinal()
+        first_skipped = meta.since.day - 1
+        last_days = meta.till.day
+
+        values = list()
+        for ic in range(offset, offset + count):
+            month = month_dates[ic]
+            if month < before or month > after:
+                values.append(0.0)
+            elif month <= since:
+                values.append(rate * (month_days[ic] - first_skipped))
+            elif till <= month_ends[ic]:
+                values.append(rate * last_days)
+            else:
+                values.append(rate * month_days[ic])
+
+        matrix.append(values)
+
+    return matrix
 
+def main_dzo_evaluate_cell(meta, header):
+    month = main_dzo_header_date(header)
+    duration = (meta.till - meta.since).days + 1
+    if duration <= 0:
+        return None
+
+    if month < main_dzo_end_of_month(meta.since, -1):
+        usage = 0
+    elif month > main_dzo_end_of_month(meta.till, 0):
+        usage = 0
+    elif month <= meta.since:
+        usage = main_dzo_end_of_month(month, 0).day - meta.since.day + 1
+    elif meta.till <= main_dzo_end_of_month(month, 0):
+        usage = meta.till.day
+    else:
+        usage = main_dzo_end_of_month(month, 0).day
+
+    return meta.money / duration * usage
+
+def main_dzo_pad_headers(date_anchor, column_max):
+    (anchor_column, anchor_date, headers) = date_anchor
+    return headers + [None] * (column_max - anchor_column + 1 - len(headers))
+
+def main_dzo_verify(transactions, date_anchor):
+    (spans, column_max) = main_dzo_plan_spans(transactions, date_anchor)
+    headers = main_dzo_pad_headers(date_anchor, column_max)
+    matrix = main_dzo_compute_matrix(spans, headers)
+
+    cells_num = 0
+    mismatches = list()
+    for ((id, meta, offset, count), values) in zip(spans, matrix):
+        for (ic, value) in zip(range(offset, offset + count), values):
+            expected = main_dzo_evaluate_cell(meta, headers[ic])
+            cells_num += 1
+            if value is None or expected is None:
+                if value is not expected:
+                    mismatches.append((id, headers[ic], expected, value))
+            elif not math.isclose(value, expected, rel_tol=1e-9, abs_tol=1e-9):
+                mismatches.append((id, headers[ic], expected, value))
+
+    print('Verified %d matrix cells of %d transactions' % (cells_num, len(spans)))
+    for (id, header, expected, value) in mismatches:
+        print('- %s @%s: formula %s, computed %s' % (id, main_dzo_header_date(header), expected, value))
+    if not mismatches:
+        print('No issues found')
+    print()
+
+def main_dzo_formula_for_matrix_cell(lang, cell_map):
+    condition_map = {
+        'condition_before': '%(cell_month)s < EOMONTH(%(cell_since)s; -1)' % cell_map,
+        'condition_first': '%(cell_month)s <= %(cell_since)s' % cell_map,
+        'condition_last': '%(cell_till)s <= EOMONTH(%(cell_month)s; 0)' % cell_map,
+        'condition_after': '%(cell_month)s > EOMONTH(%(cell_till)s; 0)' % cell_map,
+    }
+
+    value_map = {
+        'value_money': common_excel_comment(lang, "Сумма счёта:") + '%(cell_money)s' % cell_map,
+        'value_duration': common_excel_comment(lang, "Колво дней в периоде:") + 'DATEDIF(%(cell_since)s; %(cell_till)s; "d") + 1' % cell_map,
+        'value_before': common_excel_comment(lang, "Период ещё не начался:") + '0' % cell_map,
+        'value_first': common_excel_comment(lang, "Первый месяц периода, частичное присутствие:") + 'DAY(EOMONTH(%(cell_month)s; 0)) - DAY(%(cell_since)s) + 1' % cell_map,
+        'value_middle': common_excel_comment(lang, "Промежуточный месяц периода, полное присутствие:") + 'DAY(EOMONTH(%(cell_month)s; 0))' % cell_map,
+        'value_last': common_excel_comment(lang, "Последний месяц периода, частичное присутствие:") + 'DAY(%(cell_till)s)' % cell_map,
+        'value_after': common_excel_comment(lang, "Период уже закончился:") + '0' % cell_map,
+    }
+
+    formula_map = {
+        'formula_month_usage': common_excel_comment(lang, "Колво дней периода в месяце:") + 'IF(%(condition_before)s; %(value_before)s; IF(%(condition_after)s; %(value_after)s; IF(%(condition_first)s; %(value_first)s; IF(%(condition_last)s; %(value_last)s; %(value_middle)s))))' % {**condition_map, **value_map}
+    }
+
+    return common_excel_formula(lang, '= (%(value_money)s) / (%(value_duration)s) * (%(formula_month_usage)s)' % {**value_map, **formula_map})
+
+def main_dzo_matrix_lines(lang, matrix_mode, spans, rows, date_anchor, column_max):
+    (anchor_column, anchor_date, headers) = date_anchor
+
+    if matrix_mode == MAIN_DZO_MATRIX_VALUES:
+        values = main_dzo_compute_matrix(spans, main_dzo_pad_headers(date_anchor, column_max))
+    elif matrix_mode == MAIN_DZO_MATRIX_DIRECT:
+        formula = main_dzo_formula_for_matrix_cell(lang, MAIN_DZO_DIRECT_CELLS)
+    else:
+        formula = main_dzo_formula_for_matrix_cell(lang, MAIN_DZO_INDIRECT_CELLS)
+
+    lines = list()
+    for (index, ((id, meta, offset, months), row)) in enumerate(zip(spans, rows)):
+        line = [None] * (column_max - anchor_column + 1)
+        if matrix_mode == MAIN_DZO_MATRIX_VALUES:
+            line[offset:offset + months] = values[index]
+        elif matrix_mode == MAIN_DZO_MATRIX_DIRECT:
+            for ic in range(offset, offset + months):
+                line[ic] = formula.format(row=row, column=common_column_letter(anchor_column + ic - 1))
+        else:
+            line[offset:offset + months] = [formula] * months
+        lines.append(line)
+
+    return lines
+
+def main_dzo_fill_matrix(lang, sheet, previous_row, initial_row, transactions, date_anchor, matrix_mode=MAIN_DZO_MATRIX_INDIRECT):
+    (anchor_column, anchor_date, headers) = date_anchor
+    row_max = initial_row + len(transactions)
+    finish_row = row_max + 2
+
+    def _formula_for_inner_result(cell_map):
         return common_excel_formula(lang, '= SUM(%(cell_first)s:%(cell_last)s)' % cell_map)
 
-    def _formula_for_outer_result():
-        cell_map = {
-            'cell_month': 'INDIRECT(ADDRESS(1; COLUMN(); 2))',
-            'cell_previous': 'INDIRECT(ADDRESS(%d; COLUMN(); 2))' % (initial_cell.row - 3),
-            'cell_current': 'INDIRECT(ADDRESS(%d; COLUMN(); 2))' % (initial_cell.row + len(transactions)),
-        }
+    def _formula_for_outer_result(cell_map):
+        if not cell_map['cell_previous']:
+            return common_excel_formula(lang, '= IF(ISBLANK(%(cell_month)s); 0; %(cell_current)s)' % cell_map)
 
         return common_excel_formula(lang, '= IF(ISBLANK(%(cell_month)s); 0; SUM(%(cell_previous)s; %(cell_current)s))' % cell_map)
 
-    print('Formula for matrix cells:')
-    print(_formula_for_matrix_cell())
-    print()
+    if matrix_mode == MAIN_DZO_MATRIX_INDIRECT:
+        matrix_formula = main_dzo_formula_for_matrix_cell(lang, MAIN_DZO_INDIRECT_CELLS)
+        inner_formula = _formula_for_inner_result({
+            'cell_first': 'INDIRECT(ADDRESS(%d; COLUMN(); 2))' % (initial_row),
+            'cell_last': 'INDIRECT(ADDRESS(%d; COLUMN(); 2))' % (initial_row + len(transactions) - 1),
+        })
+        outer_formula = _formula_for_outer_result({
+            'cell_month': 'INDIRECT(ADDRESS(1; COLUMN(); 2))',
+            'cell_previous': 'INDIRECT(ADDRESS(%d; COLUMN(); 2))' % (previous_row) if previous_row else None,
+            'cell_current': 'INDIRECT(ADDRESS(%d; COLUMN(); 2))' % (initial_row + len(transactions)),
+        })
+
+        _matrix_cell = lambda row, column: matrix_formula
+        _inner_cell = lambda column: inner_formula
+        _outer_cell = lambda column: outer_formula
+    else:
+        matrix_formula = main_dzo_formula_for_matrix_cell(lang, MAIN_DZO_DIRECT_CELLS)
+        inner_formula = _formula_for_inner_result({
+            'cell_first': '{column}%d' % (initial_row),
+            'cell_last': '{column}%d' % (initial_row + len(transactions) - 1),
+        })
+        outer_formula = _formula_for_outer_result({
+            'cell_month': '{column}$1',
+            'cell_previous': '{column}%d' % (previous_row) if previous_row else None,
+            'cell_current': '{column}%d' % (initial_row + len(transactions)),
+        })
+
+        _matrix_cell = lambda row, column: matrix_formula.format(row=row, column=common_column_letter(column - 1))
+        _inner_cell = lambda column: inner_formula.format(column=common_column_letter(column - 1))
+        _outer_cell = lambda column: outer_formula.format(column=common_column_letter(column - 1))
+
+    if matrix_mode != MAIN_DZO_MATRIX_VALUES:
+        print('Formula for matrix cells:')
+        print(_matrix_cell(initial_row, anchor_column))
+        print()
     print('Formula for inner result:')
-    print(_formula_for_inner_result())
+    print(_inner_cell(anchor_column))
     print()
     print('Formula for outer result:')
-    print(_formula_for_outer_result())
+    print(_outer_cell(anchor_column))
     print()
 
-    worksheet.range((row_max, 1)).value = 'Итого'
+    (spans, column_max) = main_dzo_plan_spans(transactions, date_anchor)
+    rows = range(initial_row, initial_row + len(spans))
+    matrix = main_dzo_matrix_lines(lang, matrix_mode, spans, rows, date_anchor, column_max)
 
-    finish_cell = initial_cell.offset(len(transactions) + 2, 0)
-    previous_cell.copy(finish_cell)
-    finish_cell.offset(0, 0).value = 'ИТОГО ???'
-    for ic in range(date_anchor.column - 1, worksheet.used_range.last_cell.column):
-        finish_cell.offset(0, ic).value = None
+    sheet.write_block(initial_row, anchor_column, matrix)
 
-    for ir in range(initial_cell.row, row_max):
-        id = worksheet.range((ir, 2)).value
-        meta = transactions[id]
+    inner_line = ['Итого', None, _inner_cell(3)] + [None] * (anchor_column - 4)
+    inner_line += [_inner_cell(column) for column in range(anchor_column, column_max + 1)]
+    sheet.write_block(row_max, 1, [inner_line])
 
-        offset = common_calc_date_diff(date_anchor.value, meta.since)
-        months = common_calc_date_diff(meta.since, meta.till) + 1
+    if previous_row:
+        sheet.copy_row(previous_row, finish_row)
 
-        for ic in range(0, months):
-            column = date_anchor.column + offset + ic
-            column_max = max(column_max, column)
-            worksheet.range((ir, column)).value = _formula_for_matrix_cell()
-        
-    for ic in ([2] + [*range(date_anchor.column, column_max)]):
-        initial_cell.offset(len(transactions), ic).value = _formula_for_inner_result()
-    
-    for ic in range(date_anchor.column - 1, worksheet.used_range.last_cell.column):
-        finish_cell.offset(0, ic).value = _formula_for_outer_result()
+    column_last = max(sheet.last_column(), column_max)
+    sheet.write_block(finish_row, 1, [['ИТОГО ???']])
+    sheet.write_block(finish_row, anchor_column, [[_outer_cell(column) for column in range(anchor_column, column_last + 1)]])
 
 if __name__ == '__main__':
     main(sys.argv[1:])
@@ -0,0 +1,499 @@
+import csv
+import itertools
+import sqlite3
+
+import helper
+
+def scan_csv(path, columns, where=None, encoding='utf-8', short=None):
+    meta = helper.Common_FileMeta(helper.Common_FileKind.YOOKASSA, str(path), encoding)
+    return list(helper.common_scan_csv(meta, columns, where, short))
+
+def read_csv(path, columns, where=None, encoding='utf-8'):
+    where = where if where else dict()
+    width = max(list(columns) + list(where.keys())) + 1
+    with open(path, encoding=encoding, newline='') as file:
+        return [tuple([row[ic] for ic in columns]) for row in csv.reader(file, delimiter=';')
+            if len(row) >= width and all([row[ic] == value for (ic, value) in where.items()])]
+
+CSV_PLAIN_ROWS = ''.join(['a;b;c;Оплачен;e;f;g;%d\n' % (id,) for id in range(1000, 1400)])
+CSV_TRICKY_ROWS = (
+    'a;ООО "Ромашка";c;Оплачен;e;f;g;111\n'
+    'a;b;c;Оплачен;e;f;g;112\n'
+    'a;"quoted; with delimiter";c;Оплачен;e;f;g;113\n'
+    'a;"multi\nline;Оплачен;x;y;z;w;999";c;Оплачен;e;f;g;114\n'
+    'a;"say ""hi""";c;Отменён;e;f;g;115\n'
+    '"a";"b";"c";"Оплачен";"e";"f";"g";"116"\n'
+    'a;b;c;Оплачен;e;f;g;117\r\n'
+    'a;b;c;Оплачен\n'
+)
+
+def test_scan_csv_matches_csv_reader(tmp_path, monkeypatch):
+    monkeypatch.setattr(helper, 'COMMON_CSV_CHUNK', 256)
+
+    for content in (CSV_PLAIN_ROWS, CSV_TRICKY_ROWS, CSV_PLAIN_ROWS + CSV_TRICKY_ROWS + CSV_PLAIN_ROWS):
+        path = tmp_path / 'yookassa.csv'
+        path.write_bytes(content.encode('utf-8'))
+
+        for (columns, where) in (((7,), {3: 'Оплачен'}), ((7, 1), {3: 'Оплачен'}), ((1, 7), None)):
+            assert scan_csv(path, columns, where) == read_csv(path, columns, where)
+
+def test_scan_csv_reads_only_quoted_records_with_csv(tmp_path, monkeypatch):
+    content = CSV_PLAIN_ROWS + 'a;"long\n%s";c;Оплачен;e;f;g;120\n' % ('\n'.join(['x'] * 300),) + CSV_TRICKY_ROWS + CSV_PLAIN_ROWS
+    path = tmp_path / 'yookassa.csv'
+    path.write_bytes(content.encode('utf-8'))
+    expected = read_csv(path, (7, 1), {3: 'Оплачен'})
+
+    parsed = list()
+    reader = csv.reader
+    monkeypatch.setattr(helper.csv, 'reader', lambda lines, **kwargs: reader((parsed.append(line) or line for line in lines), **kwargs))
+    for size in (16, 100, 4096, 1 << 20):
+        monkeypatch.setattr(helper, 'COMMON_CSV_CHUNK', size)
+        parsed.clear()
+
+        assert scan_csv(path, (7, 1), {3: 'Оплачен'}) == expected
+        assert len(parsed) == 307
+
+def test_scan_csv_reports_short_rows(tmp_path, monkeypatch):
+    path = tmp_path / 'yookassa.csv'
+    path.write_bytes((CSV_PLAIN_ROWS + CSV_TRICKY_ROWS + 'a;"q";c;Оплачен;e\nb;c\n' + CSV_PLAIN_ROWS + 'a;b;c;Оплачен;e;f').encode('utf-8'))
+
+    for size in (16, 256, 1 << 20):
+        monkeypatch.setattr(helper, 'COMMON_CSV_CHUNK', size)
+        short = list()
+
+        assert scan_csv(path, (7, 1), {3: 'Оплачен'}, short=short) == read_csv(path, (7, 1), {3: 'Оплачен'})
+        assert short == [('', 'b'), ('', 'q'), ('', 'b')]
+
+def test_scan_csv_keeps_bare_quotes(tmp_path):
+    path = tmp_path / 'yookassa.csv'
+    path.write_bytes(CSV_TRICKY_ROWS.encode('utf-8'))
+
+    assert scan_csv(path, (7,), {3: 'Оплачен'}) == [('111',), ('112',), ('113',), ('114',), ('116',), ('117',)]
+
+def test_scan_csv_single_byte_encoding(tmp_path):
+    path = tmp_path / 'alfa.csv'
+    path.write_bytes((CSV_PLAIN_ROWS + CSV_TRICKY_ROWS).encode('cp1251'))
+
+    assert scan_csv(path, (7, 1), {3: 'Оплачен'}, 'cp1251') == read_csv(path, (7, 1), {3: 'Оплачен'}, 'cp1251')
+
+def test_match_names_keeps_different_inns_apart():
+    first = [('7700000001', 'ООО "Контрагент 12"'), ('ООО Ромашка', 'ООО Ромашка')]
+    second = [('7700000002', 'ООО "Контрагент 13"'), ('7700000003', 'ООО "Ромашка"')]
+
+    (pairs, first_rest, second_rest) = helper.main_sixtytwo_match_names(first, second)
+
+    assert [(first_item, second_item) for (score, first_item, second_item) in pairs] == [(first[1], second[1])]
+    assert first_rest == [first[0]]
+    assert second_rest == [second[0]]
+
+def test_match_names_pairs_inn_with_name_keyed():
+    first = [('7700000001', 'ООО "Контрагент 12"')]
+    second = [('ООО Контрагент 12', 'ООО Контрагент 12'), ('7700000009', 'ООО "Контрагент 12"')]
+
+    (pairs, first_rest, second_rest) = helper.main_sixtytwo_match_names(first, second)
+
+    assert [(first_item, second_item) for (score, first_item, second_item) in pairs] == [(first[0], second[0])]
+    assert second_rest == [second[1]]
+
+def test_dzo_source_reports_malformed_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(helper.common_options, 'cache', False)
+    path = tmp_path / 'payments.csv'
+    path.write_bytes((
+        '2;2024-03-05;SBS;1002.5;2024-03-10;2025-03-09\n'
+        '1;2024-02-05;SBS;1001.5;2024-02-10;2025-02-09\n'
+        '3;2024-04-05;OTH;1003.5;2024-04-10;2025-04-09\n'
+        '4;2024-13-05;SBS;10;2024-02-10;2025-02-09\n'
+        '5;2024-01-01;SBS;100.00;2024-01-01\n'
+        '1;2024-2-5;SBS;7;2024-02-10;2025-02-09\n'
+    ).encode('utf-8'))
+
+    transactions = helper.main_dzo_read_source(str(path))
+
+    assert list(transactions) == [1, 2]
+    assert transactions[1].money == 7.0
+    assert transactions.period() == (helper.date(2024, 2, 10), helper.date(2025, 3, 9))
+    assert sorted(transactions.errors) == [
+        ('1', 'duplicate id, the later row is used'),
+        ('4', 'column B: not a date "2024-13-05"'),
+        ('5', 'too few columns'),
+    ]
+
+def test_cache_write_failure_keeps_result(tmp_path, capsys, monkeypatch):
+    (tmp_path / 'file').write_text('')
+    (tmp_path / 'input.csv').write_text('1;2\n')
+    monkeypatch.setattr(helper.common_options, 'cache', True)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'file'))
+
+    parse = helper.common_cached('test', 1)(lambda name: [name])
+
+    assert parse(str(tmp_path / 'input.csv')) == [str(tmp_path / 'input.csv')]
+    assert 'Not cached' in capsys.readouterr().err
+
+def test_banking_watch_missing_inbox(tmp_path, capsys):
+    helper.main_banking_watch(['--once', str(tmp_path / 'inbox')])
+
+    assert 'Not readable' in capsys.readouterr().out
+    assert not (tmp_path / 'inbox').exists()
+
+XLSX_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+XLSX_WORKBOOK = (
+    '<workbook xmlns="%s" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Data" sheetId="1" r:id="rId1"/></sheets></workbook>'
+) % (XLSX_MAIN,)
+XLSX_RELS = (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+XLSX_STRINGS = (
+    '<sst xmlns="%s">'
+    '<si><t>plain</t></si>'
+    '<si><r><t>rich </t></r><r><rPr><b/></rPr><t>text</t></r></si>'
+    '<si><t>東京</t><rPh sb="0" eb="2"><t>トウキョウ</t></rPh><phoneticPr fontId="1"/></si>'
+    '</sst>'
+) % (XLSX_MAIN,)
+XLSX_SHEET = (
+    '<worksheet xmlns="%s"><sheetData>'
+    '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="C1"><v>1.5</v></c></row>'
+    '<row r="4"><c r="B4" t="s"><v>1</v></c><c r="D4" t="inlineStr"><is><t>inline</t></is></c></row>'
+    '<row><c t="s"><v>2</v></c><c t="inlineStr"><is><t>大阪</t><rPh sb="0" eb="2"><t>オオサカ</t></rPh></is></c><c t="b"><v>1</v></c></row>'
+    '<row r="6"><c r="B6" t="str"><v>formula</v></c><c r="C6"/></row>'
+    '</sheetData></worksheet>'
+) % (XLSX_MAIN,)
+
+def write_xlsx(path, sheet=XLSX_SHEET):
+    import zipfile
+
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('xl/workbook.xml', XLSX_WORKBOOK)
+        archive.writestr('xl/_rels/workbook.xml.rels', XLSX_RELS)
+        archive.writestr('xl/sharedStrings.xml', XLSX_STRINGS)
+        archive.writestr('xl/worksheets/sheet1.xml', sheet)
+
+def test_xlsx_rows_follow_sparse_references(tmp_path):
+    path = tmp_path / 'sheet.xlsx'
+    write_xlsx(path)
+
+    sheet = helper.common_open_sheet(str(path))
+    try:
+        assert list(sheet.iter_rows()) == [
+            ['plain', '', 1.5],
+            [],
+            [],
+            ['', 'rich text', '', 'inline'],
+            ['東京', '大阪', 1],
+            ['', 'formula', ''],
+        ]
+        assert list(sheet.iter_rows(columns=[3, 1], start=3)) == [
+            ['inline', 'rich text'],
+            ['', '大阪'],
+            ['', 'formula'],
+        ]
+        assert sheet.columns([0, 2], 1) == [['', '', '', '東京', ''], ['', '', '', 1, '']]
+    finally:
+        sheet.close()
+
+def test_xlsx_rows_survive_any_chunking(tmp_path, monkeypatch):
+    path = tmp_path / 'sheet.xlsx'
+    write_xlsx(path)
+
+    sheet = helper.common_open_sheet(str(path))
+    expected = list(sheet.iter_rows())
+    for size in (1, 7, 64):
+        monkeypatch.setattr(helper, 'COMMON_XLSX_CHUNK', size)
+        assert list(sheet.iter_rows()) == expected
+    sheet.close()
+
+ORDER_SET_IDS = (0, 7, 8, 4095, 65534, 65535, 65536, 65537, 131071, 131072, 1 << 40)
+
+def test_order_set_algebra_across_chunks():
+    first = set(ORDER_SET_IDS)
+    second = set([65535, 65536, 8, 200000, (1 << 40) + 1])
+    (first_set, second_set) = (helper.Common_OrderSet(sorted(first, reverse=True)), helper.Common_OrderSet(second))
+
+    assert list(first_set) == sorted(first)
+    assert len(first_set) == len(first)
+    assert all([id in first_set for id in first])
+    assert not any([id in first_set for id in (1, 65533, 65538, 131073, (1 << 40) - 1)])
+
+    assert list(first_set - second_set) == sorted(first - second)
+    assert list(second_set.difference(first_set)) == sorted(second - first)
+    assert list(first_set | second_set) == sorted(first | second)
+    assert first_set.union(second_set) == helper.Common_OrderSet(first | second)
+
+def test_order_set_sparse_and_dense_ranges():
+    sparse = set([id * 70000 for id in range(0, 20000)])
+    dense = set(range(131072, 131072 + 10000))
+    (sparse_set, dense_set) = (helper.Common_OrderSet(sparse), helper.Common_OrderSet(sorted(dense, reverse=True)))
+
+    assert all([not isinstance(chunk, int) for chunk in sparse_set.chunks.values()])
+    assert list(sparse_set) == sorted(sparse)
+    assert len(sparse_set) == len(sparse)
+    assert 69999 * 70000 not in sparse_set and 70001 not in sparse_set
+
+    both = sparse_set | dense_set
+    assert list(both) == sorted(sparse | dense)
+    assert list(both - sparse_set) == sorted(dense - sparse)
+    assert list(sparse_set - dense_set) == sorted(sparse - dense)
+
+    thinned = dense_set - helper.Common_OrderSet(range(131072, 131072 + 9000))
+    assert thinned == helper.Common_OrderSet(range(131072 + 9000, 131072 + 10000))
+    assert all([not isinstance(chunk, int) for chunk in thinned.chunks.values()])
+
+def test_order_set_empty_results():
+    orders = helper.Common_OrderSet([65535, 65536])
+
+    assert not helper.Common_OrderSet()
+    assert not orders - orders
+    assert (orders - orders) == helper.Common_OrderSet()
+    assert list(orders - orders) == []
+    assert len(helper.Common_OrderSet() | orders) == 2
+
+def test_external_sorted_spills_and_merges(tmp_path):
+    values = [(id * 7919) % 1000 for id in range(0, 3000)]
+
+    merged = list(helper.common_external_sorted(iter(values), str(tmp_path), 64))
+
+    assert merged == sorted(set(values))
+    assert list(tmp_path.iterdir()) == []
+
+def test_symmetric_difference_reports_sides():
+    first = iter([1, 2, 4, 6, 9])
+    second = iter([2, 3, 4, 10, 11])
+
+    assert list(helper.common_symmetric_difference(first, second)) == [(1, 0), (3, 1), (6, 0), (9, 0), (10, 1), (11, 1)]
+
+def write_column_xlsx(path, columns):
+    rows = list()
+    for (ir, row) in enumerate(itertools.zip_longest(*columns, fillvalue='')):
+        cells = ''.join(['<c r="%s%d" t="inlineStr"><is><t>%s</t></is></c>' % (helper.common_column_letter(ic), ir + 1, value)
+            for (ic, value) in enumerate(row) if value != ''])
+        rows.append('<row r="%d">%s</row>' % (ir + 1, cells))
+
+    write_xlsx(path, '<worksheet xmlns="%s"><sheetData>%s</sheetData></worksheet>' % (XLSX_MAIN, ''.join(rows)))
+
+def run_both_ways(capsys, monkeypatch, function, argv):
+    monkeypatch.setattr(helper.common_options, 'cache', False)
+    monkeypatch.setattr(helper.common_options, 'history', False)
+
+    function(argv)
+    in_memory = capsys.readouterr().out
+
+    monkeypatch.setattr(helper.common_options, 'external', True)
+    monkeypatch.setattr(helper.common_options, 'memory_budget', 256)
+    function(argv)
+    external = capsys.readouterr().out
+
+    return (in_memory, external)
+
+def test_external_transactions_match_in_memory(tmp_path, capsys, monkeypatch):
+    primary = ['%09d' % (id,) for id in range(1000, 1600)]
+    copy = ['%09d' % (id,) for id in range(1003, 1600, 2)] + ['%09d' % (id,) for id in range(1000, 1100)] + ['000009999']
+    write_column_xlsx(tmp_path / 'primary.xlsx', [['x'] * (len(primary) + 1), [''] * (len(primary) + 1), ['id'] + primary])
+    write_column_xlsx(tmp_path / 'copy.xlsx', [['x'] * (len(copy) + 1), [''] * (len(copy) + 1), ['id'] + copy])
+
+    (in_memory, external) = run_both_ways(capsys, monkeypatch, helper.main_transactions, [str(tmp_path / 'primary.xlsx'), str(tmp_path / 'copy.xlsx')])
+
+    assert in_memory == external
+    assert '- 9999\n' in in_memory and '- 1100\n' in in_memory and '- 1101\n' not in in_memory
+
+def test_external_simple_matches_in_memory(tmp_path, capsys, monkeypatch):
+    first = ['header'] + ['v%04d' % (id,) for id in range(0, 500)] + ['']
+    second = ['header'] + ['v%04d' % (id,) for id in range(250, 760)] + ['v0001']
+    third = ['header'] + ['v%04d' % (id,) for id in range(0, 502)]
+    write_column_xlsx(tmp_path / 'doc.xlsx', [first, second, third])
+
+    (in_memory, external) = run_both_ways(capsys, monkeypatch, helper.main_simple, [str(tmp_path / 'doc.xlsx'), 'A:B:C'])
+
+    assert in_memory == external
+    assert 'A & C, please check these values:\n- v0500\n- v0501\n' in in_memory
+
+def test_simple_specs_carry_sheet_prefix():
+    comparisons = helper.main_simple_parse_specs(['A:B', 'Sheet2!A:B', 'Sheet2!C:Sheet3!C:D'])
+
+    assert [(first.label(), second.label()) for (first, second) in comparisons] == [
+        ('A', 'B'),
+        ('Sheet2!A', 'Sheet2!B'),
+        ('Sheet2!C', 'Sheet3!C'),
+        ('Sheet2!C', 'Sheet3!D'),
+        ('Sheet3!C', 'Sheet3!D'),
+    ]
+
+def test_order_set_builder_matches_bulk_construction():
+    builder = helper.Common_OrderSetBuilder()
+    for id in reversed(ORDER_SET_IDS):
+        builder.add(id)
+
+    assert builder.build() == helper.Common_OrderSet(ORDER_SET_IDS)
+    assert not helper.Common_OrderSetBuilder().build()
+
+def record_history(scope, items, fail=False):
+    with helper.common_history('banking', scope, []) as history:
+        history.add_items('AlfaBank', 'BANK', items)
+        if fail:
+            raise ValueError('interrupted')
+
+def read_open_items(path):
+    connection = sqlite3.connect(path)
+    try:
+        return sorted(connection.execute('SELECT scope, item, since, run_id FROM open_items'))
+    finally:
+        connection.close()
+
+def test_history_keeps_open_items_until_they_match(tmp_path, monkeypatch):
+    path = str(tmp_path / 'history.sqlite3')
+    monkeypatch.setattr(helper.common_options, 'history', True)
+    monkeypatch.setattr(helper.common_options, 'history_path', path)
+    monkeypatch.setattr(helper, 'common_history_now', iter(['2026-01-0%d 10:00:00' % (day,) for day in range(1, 10)]).__next__)
+
+    record_history('january', [1, 2])
+    record_history('january', [2, 3])
+    record_history('february', [1])
+
+    assert read_open_items(path) == [
+        ('february', '1', '2026-01-03 10:00:00', 3),
+        ('january', '2', '2026-01-01 10:00:00', 2),
+        ('january', '3', '2026-01-02 10:00:00', 2),
+    ]
+
+    try:
+        record_history('january', [], fail=True)
+    except ValueError:
+        pass
+
+    assert len(read_open_items(path)) == 3
+
+    record_history('january', [])
+
+    assert read_open_items(path) == [('february', '1', '2026-01-03 10:00:00', 3)]
+
+def test_history_failure_only_warns(tmp_path, capsys, monkeypatch):
+    (tmp_path / 'file').write_text('')
+    monkeypatch.setattr(helper.common_options, 'history', True)
+    monkeypatch.setattr(helper.common_options, 'history_path', str(tmp_path / 'file' / 'history.sqlite3'))
+
+    with helper.common_history('transactions', '', []) as history:
+        history.add_items('Transactions', 'PRIMARY', range(0, helper.COMMON_EXTERNAL_BATCH + 1))
+        entries = list(history.track('Transactions', helper.MAIN_TRANSACTIONS_SIDES, [('a', 0), ('b', 1)]))
+        history.add_difference('names', ('1', 'x'), ('2', 'y'))
+
+    assert entries == ['a', 'b']
+    assert 'History not recorded' in capsys.readouterr().err
+
+def test_banking_layout_prefers_specific_headers():
+    layout = helper.MainBanking_Layout([['Описание', 'Сумма', 'Дата', 'Сумма платежа', 'Дата операции']], 0, (5,))
+
+    assert layout.columns() == (0, 3, 4, 5)
+    assert layout.record(7, 1, '1 234,50', '05.03.2024') == (7, 1, 1234.5, helper.date(2024, 3, 5).toordinal(), None)
+
+    layout = helper.MainBanking_Layout([['Номер', 'Назначение']], 1)
+
+    assert layout.columns() == (1, 1, 1)
+    assert layout.record(7, 1, '7', '7', 'Оплачен') == (7, 1, None, None, 'Оплачен')
+
+def test_banking_accumulate_partial_payments_and_statuses():
+    entries = dict()
+    for record in (
+        (1, 0, 100.0, 10, None),
+        (1, 1, 50.0, 12, None),
+        (1, 2, None, 11, None),
+        (2, 3, 70.0, 5, 'Оплачен'),
+        (2, 4, 70.0, 6, 'Отменён'),
+        (3, 5, 30.0, 8, 'Отменён'),
+        (3, 6, 30.0, 9, 'Оплачен'),
+    ):
+        helper.main_banking_accumulate(entries, record)
+
+    assert entries == {
+        1: [True, 150.0, 12, None],
+        2: [False, 70.0, 5, 'Отменён'],
+        3: [True, 30.0, 9, 'Оплачен'],
+    }
+
+def test_banking_classify_reports_each_class():
+    options = helper.MainBanking_Options()
+    (options.tolerance, options.window) = (0.01, 3)
+    paid = lambda amount, day: [True, amount, day, None]
+    cancelled = [False, 1.0, 10, 'Отменён']
+
+    (counts, details) = helper.main_banking_classify(options, [
+        (1, paid(100.0, 10), paid(100.0, 11)),
+        (2, paid(100.0, 10), paid(100.5, 10)),
+        (3, paid(100.0, 10), paid(100.0, 20)),
+        (4, paid(100.0, 10), None),
+        (5, None, paid(100.0, 10)),
+        (6, None, cancelled),
+        (7, paid(1.0, 10), cancelled),
+        (8, paid(100.0, 10), paid(100.01, 13)),
+        (9, paid(None, None), paid(100.0, 10)),
+    ])
+
+    assert counts == {'matched': 3, 'amount-mismatch': 1, 'date-mismatch': 1, 'missing': 3}
+    assert {name: [id for (id, found, expected) in rows] for (name, rows) in details.items()} == {
+        'amount-mismatch': [2],
+        'date-mismatch': [3],
+        'missing': [4, 5, 7],
+    }
+
+def dzo_meta(since, till, money, activated=None):
+    return helper.MainBanking_Dzo(activated or since, money, since, till)
+
+DZO_HEADERS = [helper.datetime(2024, month, 1) for month in range(1, 6)] + [None]
+
+def test_dzo_compute_matrix_prorates_months():
+    spans = [
+        (1, dzo_meta(helper.date(2024, 1, 15), helper.date(2024, 3, 10), 56.0), 0, 5),
+        (2, dzo_meta(helper.date(2024, 2, 1), helper.date(2024, 3, 31), 120.0), 1, 2),
+        (3, dzo_meta(helper.date(2024, 4, 1), helper.date(2024, 5, 15), 45.0), 3, 3),
+        (4, dzo_meta(helper.date(2024, 3, 2), helper.date(2024, 3, 1), 5.0), 2, 1),
+    ]
+
+    matrix = helper.main_dzo_compute_matrix(spans, DZO_HEADERS)
+
+    assert matrix == [
+        [17.0, 29.0, 10.0, 0.0, 0.0],
+        [58.0, 62.0],
+        [30.0, 15.0, 0.0],
+        [None],
+    ]
+    for ((id, meta, offset, count), values) in zip(spans, matrix):
+        assert values == [helper.main_dzo_evaluate_cell(meta, header) for header in DZO_HEADERS[offset:offset + count]]
+
+def write_dzo_workbook(path, rows):
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = helper.MAIN_DZO_SHEET
+    for (ic, header) in enumerate(DZO_HEADERS[:-1]):
+        worksheet.cell(1, helper.MAIN_DZO_FIRST_DATE_COLUMN + ic).value = header
+    for (ir, row) in enumerate(rows):
+        for (ic, value) in enumerate(row):
+            worksheet.cell(3 + ir, 1 + ic).value = value
+    workbook.save(path)
+
+def test_dzo_find_delta_and_update_rows(tmp_path, capsys):
+    path = str(tmp_path / 'dzo.xlsx')
+    write_dzo_workbook(path, [
+        (helper.datetime(2024, 1, 10), 1, 31.0, helper.datetime(2024, 1, 1), helper.datetime(2024, 1, 31)),
+        ('10.01.2024', '2', 10.0, '01.02.2024', '29.02.2024'),
+        (None, 'note', None, None, None),
+    ])
+    transactions = helper.MainDzo_Transactions()
+    for (id, money, since, till) in ((1, 31.0, helper.date(2024, 1, 1), helper.date(2024, 1, 31)), (2, 60.0, helper.date(2024, 2, 1), helper.date(2024, 3, 31)), (3, 1.0, helper.date(2024, 4, 1), helper.date(2024, 4, 1))):
+        transactions.append(id, helper.date(2024, 1, 10).toordinal(), money, since.toordinal(), till.toordinal())
+
+    sheet = helper.main_dzo_open_sheet(path, True)
+    (fresh, changed) = helper.main_dzo_find_delta(transactions, helper.main_dzo_read_existing(sheet))
+
+    assert list(fresh) == [3]
+    assert [(id, row) for (id, (row, meta)) in changed.items()] == [(2, 4)]
+
+    date_anchor = helper.main_dzo_plan_date_headers(sheet, helper.date(2024, 1, 1), helper.date(2024, 4, 1))
+    helper.main_dzo_update_rows('en', sheet, changed, date_anchor, helper.MAIN_DZO_MATRIX_VALUES)
+    sheet.save()
+
+    assert 'Updating the line #4: 2' in capsys.readouterr().out
+    sheet = helper.main_dzo_open_sheet(path, True)
+    assert sheet.read_block(3, 2, 2, 4) == [[1, 31.0, helper.datetime(2024, 1, 1), helper.datetime(2024, 1, 31)], [2, 60.0, helper.datetime(2024, 2, 1), helper.datetime(2024, 3, 31)]]
+    assert sheet.read_block(4, helper.MAIN_DZO_FIRST_DATE_COLUMN, 1, 4) == [[None, 29.0, 31.0, None]]